@@ -42,20 +42,26 @@ Usage:
 """
 
 import argparse
+import math
 import os
 import re
 import sys
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from glob import glob
+from itertools import chain
+import multiprocessing
 from multiprocessing import cpu_count
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import duckdb
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 # Try to import tqdm for progress bars
 try:
@@ -67,6 +73,49 @@ except ImportError:
 
 # Add parent directory for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
+from funder_analysis.normalize_funders import (
+    HAS_AHOCORASICK, HAS_HYPERSCAN, FunderNormalizer, build_literal_prefilter,
+    build_hyperscan_prefilter, scan_funders
+)
+
+# Dashboard parquet schema, in output column order
+OUTPUT_SCHEMA = pa.schema([
+    ('pmid', pa.int32()),
+    ('journal', pa.string()),
+    ('affiliation_country', pa.string()),
+    ('is_open_data', pa.bool_()),
+    ('is_open_code', pa.bool_()),
+    ('year', pa.int16()),
+    ('funder', pa.list_(pa.string())),
+    ('data_tags', pa.list_(pa.string())),
+    ('created_at', pa.string()),
+])
+
+# pandas dtypes the dashboard has always been read back with; stored as the
+# parquet's pandas metadata so pd.read_parquet keeps nullable pmid and year
+OUTPUT_PANDAS_DTYPES = {
+    'pmid': 'Int64',
+    'journal': 'str',
+    'affiliation_country': 'str',
+    'is_open_data': 'bool',
+    'is_open_code': 'bool',
+    'year': 'Int32',
+    'funder': 'object',
+    'data_tags': 'object',
+    'created_at': 'str',
+}
+OUTPUT_SCHEMA = OUTPUT_SCHEMA.with_metadata(pa.Schema.from_pandas(
+    pd.DataFrame({c: pd.Series(dtype=t) for c, t in OUTPUT_PANDAS_DTYPES.items()}),
+    preserve_index=False,
+).metadata)
+
+# Output rows are sorted by these columns so readers filtering on them can
+# skip row groups using the min/max statistics
+OUTPUT_SORT_COLUMNS = ['year', 'journal']
+
+# Low-cardinality string columns held dictionary-encoded while matching runs
+DICTIONARY_COLUMNS = ('license', 'journal', 'affiliation_country')
+OUTPUT_ROW_GROUP_SIZE = 256_000
 
 
 def log_time(msg: str, start_time: float = None) -> float:
@@ -174,13 +223,24 @@ Examples:
         "--chunk-size",
         type=int,
         default=100000,
-        help="Chunk size for funder matching (default: 100000)",
+        help="Minimum chunk size for funder matching; raised so each worker "
+             "gets about 4 chunks (default: 100000)",
     )
     parser.add_argument(
         "--threads",
         type=int,
         default=None,
-        help="Number of DuckDB threads (default: auto)",
+        help="Number of DuckDB threads (default: CPU count)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        default=None,
+        help="DuckDB memory limit, e.g. '48GB' (default: DuckDB's 80%% of RAM)",
+    )
+    parser.add_argument(
+        "--temp-dir",
+        default=None,
+        help="Directory DuckDB spills to when over the memory limit (default: DuckDB's default)",
     )
     parser.add_argument(
         "--funder-aliases",
@@ -192,61 +252,150 @@ Examples:
         action="store_true",
         help="Aggregate child funders into parent totals (e.g., NIH institutes -> NIH)",
     )
+    parser.add_argument(
+        "--db-path",
+        default=None,
+        help="DuckDB database file for caching the rtrans and oddpub parquet scans "
+             "between runs (default: in-memory, nothing cached)",
+    )
+    parser.add_argument(
+        "--refresh-db",
+        action="store_true",
+        help="Rebuild the cached tables in --db-path from the parquet inputs",
+    )
+    parser.add_argument(
+        "--funder-matching",
+        choices=["python", "duckdb"],
+        default="python",
+        help="Where to match funder patterns: Python worker processes, or inside "
+             "the DuckDB query with its RE2 regex engine (default: python)",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Also list every child->parent funder relationship",
+    )
     return parser.parse_args()
 
 
+def cache_source_table(
+    conn: duckdb.DuckDBPyConnection,
+    name: str,
+    source_path: str,
+    query: str,
+    refresh: bool = False,
+) -> str:
+    """
+    Materialize a parquet source query as a native table in a persistent database.
+
+    The table is reused on later runs as long as it was built from the same
+    source path; pass refresh=True to rebuild it after the inputs change.
+
+    Returns a query selecting from the cached table.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS source_cache (name VARCHAR PRIMARY KEY, source_path VARCHAR)")
+    cached = conn.execute(
+        "SELECT source_path FROM source_cache WHERE name = ?", [name]
+    ).fetchone()
+
+    if refresh or cached is None or cached[0] != source_path:
+        cache_start = log_time(f"  Caching {name} from {source_path}...")
+        conn.execute(f"CREATE OR REPLACE TABLE {name} AS {query}")
+        conn.execute("INSERT OR REPLACE INTO source_cache VALUES (?, ?)", [name, source_path])
+        log_time(f"  Cached {name}", cache_start)
+    else:
+        log_time(f"  Using cached {name} (built from {source_path})")
+
+    return f"SELECT * FROM {name}"
+
+
+def connect_duckdb(
+    db_path: Optional[str] = None,
+    threads: Optional[int] = None,
+    memory_limit: Optional[str] = None,
+    temp_dir: Optional[str] = None,
+) -> duckdb.DuckDBPyConnection:
+    """Open the DuckDB connection used to load, join and (optionally) write the data."""
+    log_time("Initializing DuckDB...")
+
+    # Working tables are TEMP so a persistent database only keeps the
+    # cached source tables
+    conn = duckdb.connect(db_path or ':memory:')
+    conn.execute(f"SET threads TO {threads or cpu_count()}")
+    # Row order is never relied on (outputs are keyed by pmcid/pmid), so let
+    # parallel scans, joins and COPY skip the final reordering
+    conn.execute("SET preserve_insertion_order = false")
+    # Keep parquet footers in memory so files are only parsed once per run
+    conn.execute("SET parquet_metadata_cache = true")
+    if memory_limit:
+        conn.execute(f"SET memory_limit = {sql_quote(memory_limit)}")
+    if temp_dir:
+        conn.execute(f"SET temp_directory = {sql_quote(temp_dir)}")
+    return conn
+
+
 def load_data_with_duckdb(
+    conn: duckdb.DuckDBPyConnection,
     filelist_dir: str,
     rtrans_dir: str,
     oddpub_file: str,
     licenses: List[str],
     limit: Optional[int] = None,
-    threads: Optional[int] = None,
-) -> pd.DataFrame:
-    """Load and join all data sources using DuckDB for maximum speed."""
+    cache_sources: bool = False,
+    refresh_db: bool = False,
+) -> int:
+    """
+    Load and join all data sources into the TEMP table 'merged' using DuckDB.
 
-    start = log_time("Initializing DuckDB...")
+    If cache_sources is set (conn is a persistent database), the rtrans and
+    oddpub parquet scans are cached as native tables and reused by later runs.
 
-    # Create DuckDB connection with optimal settings
-    conn = duckdb.connect(':memory:')
-    if threads:
-        conn.execute(f"SET threads TO {threads}")
+    Returns the number of merged records.
+    """
+    start = time.time()
 
     # Step 1: Load PMCIDs from filelist CSVs
     log_time("Loading PMCIDs from filelist CSVs...")
 
-    # Build UNION ALL query for all filelist CSVs
-    csv_queries = []
+    # One multi-file read over every license's filelist glob lets DuckDB parse
+    # all CSVs in a single parallel scan; the license comes from the file name
+    csv_globs = []
+    license_cases = []
     for license_type in licenses:
-        pattern = f"oa_{license_type}_xml.PMC*.baseline.*.filelist.csv"
-        csv_files = sorted(glob(os.path.join(filelist_dir, pattern)))
-        log_time(f"  Found {len(csv_files)} {license_type} filelist CSVs")
-
-        for csv_file in csv_files:
-            # Note: DuckDB read_csv_auto normalizes "Accession ID" to "AccessionID"
-            csv_queries.append(f"""
-                SELECT
-                    TRIM(AccessionID) as pmcid,
-                    TRY_CAST(PMID AS BIGINT) as pmid_filelist,
-                    '{license_type}' as license
-                FROM read_csv_auto('{csv_file}', header=true)
-                WHERE AccessionID IS NOT NULL
-                  AND AccessionID LIKE 'PMC%'
-            """)
-
-    if not csv_queries:
+        prefix = f"oa_{license_type}_xml."
+        pattern = f"{prefix}PMC*.baseline.*.filelist.csv"
+        csv_count = len(glob(os.path.join(filelist_dir, pattern)))
+        log_time(f"  Found {csv_count} {license_type} filelist CSVs")
+
+        if not csv_count:
+            continue
+
+        csv_globs.append(f"'{os.path.join(filelist_dir, pattern)}'")
+        license_cases.append(f"WHEN starts_with(parse_filename(filename), '{prefix}') THEN '{license_type}'")
+
+    if not csv_globs:
         raise ValueError("No filelist CSVs found!")
 
-    # Create pmcids table from all CSVs
-    union_query = " UNION ALL ".join(csv_queries)
+    # Note: DuckDB read_csv_auto normalizes "Accession ID" to "AccessionID"
+    filelist_query = f"""
+        SELECT
+            TRIM(AccessionID) as pmcid,
+            TRY_CAST(PMID AS INTEGER) as pmid_filelist,
+            CASE {' '.join(license_cases)} END as license
+        FROM read_csv_auto([{', '.join(csv_globs)}], header=true, filename=true, union_by_name=true)
+        WHERE AccessionID IS NOT NULL
+          AND AccessionID LIKE 'PMC%'
+    """
 
-    limit_clause = f"LIMIT {limit}" if limit else ""
+    # Hash-aggregate duplicates instead of sorting everything for DISTINCT ON;
+    # with --limit, take the first N PMCIDs (a top-N, not a full sort)
+    limit_clause = f"ORDER BY pmcid LIMIT {limit}" if limit else ""
 
     conn.execute(f"""
-        CREATE TABLE pmcids AS
-        SELECT DISTINCT ON (pmcid) pmcid, pmid_filelist, license
-        FROM ({union_query})
-        ORDER BY pmcid
+        CREATE TEMP TABLE pmcids AS
+        SELECT pmcid, any_value(pmid_filelist) as pmid_filelist, any_value(license) as license
+        FROM ({filelist_query})
+        GROUP BY pmcid
         {limit_clause}
     """)
 
@@ -263,8 +412,10 @@ def load_data_with_duckdb(
 
     rtrans_pattern = os.path.join(rtrans_dir, "*.parquet")
 
-    conn.execute(f"""
-        CREATE TABLE rtrans AS
+    # The rtrans files share one schema: bind every file to the first file's
+    # schema instead of unioning schemas, skip hive-partition detection, and
+    # project only the columns used below
+    rtrans_query = f"""
         SELECT
             pmid,
             CASE
@@ -280,49 +431,65 @@ def load_data_with_duckdb(
             fund_pmc_source,
             fund_pmc_institute,
             fund_pmc_anysource
-        FROM read_parquet('{rtrans_pattern}')
+        FROM read_parquet('{rtrans_pattern}', union_by_name=false, hive_partitioning=false)
         WHERE pmcid_pmc IS NOT NULL
+    """
+    if cache_sources:
+        rtrans_query = cache_source_table(conn, 'rtrans_source', rtrans_pattern, rtrans_query, refresh_db)
+
+    # Only keep rtrans rows for PMCIDs in the filelists, so rows that the
+    # join would drop anyway are never materialized (matters with --limit)
+    conn.execute(f"""
+        CREATE TEMP TABLE rtrans AS
+        SELECT * FROM ({rtrans_query})
+        WHERE pmcid IN (SELECT pmcid FROM pmcids)
     """)
 
     rtrans_count = conn.execute("SELECT COUNT(*) FROM rtrans").fetchone()[0]
-    log_time(f"  Loaded {rtrans_count:,} rtrans records", rtrans_start)
+    log_time(f"  Loaded {rtrans_count:,} rtrans records for filelist PMCIDs", rtrans_start)
 
     # Step 3: Load oddpub data
     # NOTE: The oddpub parquet has a clean 'pmcid' column (format: PMC544856)
     # We use it directly instead of extracting from 'article' column
     oddpub_start = log_time("Loading oddpub data...")
 
-    conn.execute(f"""
-        CREATE TABLE oddpub AS
+    oddpub_query = f"""
         SELECT
             pmcid,
             is_open_data,
             is_open_code
         FROM read_parquet('{oddpub_file}')
         WHERE pmcid IS NOT NULL
+    """
+    if cache_sources:
+        oddpub_query = cache_source_table(conn, 'oddpub_source', str(oddpub_file), oddpub_query, refresh_db)
+
+    # Same semi-join as rtrans: only PMCIDs the LEFT JOIN can match
+    conn.execute(f"""
+        CREATE TEMP TABLE oddpub AS
+        SELECT * FROM ({oddpub_query})
+        WHERE pmcid IN (SELECT pmcid FROM pmcids)
     """)
 
     oddpub_count = conn.execute("SELECT COUNT(*) FROM oddpub").fetchone()[0]
-    log_time(f"  Loaded {oddpub_count:,} oddpub records", oddpub_start)
+    log_time(f"  Loaded {oddpub_count:,} oddpub records for filelist PMCIDs", oddpub_start)
 
     # Step 4: Join all tables
     join_start = log_time("Joining tables...")
 
     conn.execute("""
-        CREATE TABLE merged AS
+        CREATE TEMP TABLE merged AS
         SELECT
-            COALESCE(TRY_CAST(r.pmid AS BIGINT), TRY_CAST(p.pmid_filelist AS BIGINT)) as pmid,
+            COALESCE(TRY_CAST(r.pmid AS INTEGER), p.pmid_filelist) as pmid,
             p.pmcid,
             p.license,
             r.journal,
             r.affiliation_country,
-            COALESCE(TRY_CAST(r.year_epub AS INTEGER), TRY_CAST(r.year_ppub AS INTEGER)) as year,
+            COALESCE(TRY_CAST(r.year_epub AS SMALLINT), TRY_CAST(r.year_ppub AS SMALLINT)) as year,
             COALESCE(o.is_open_data, false) as is_open_data,
             COALESCE(o.is_open_code, false) as is_open_code,
-            COALESCE(r.fund_text, '') || ' ' ||
-            COALESCE(r.fund_pmc_source, '') || ' ' ||
-            COALESCE(r.fund_pmc_institute, '') || ' ' ||
-            COALESCE(r.fund_pmc_anysource, '') as combined_funding
+            concat_ws(' ', r.fund_text, r.fund_pmc_source,
+                      r.fund_pmc_institute, r.fund_pmc_anysource) as combined_funding
         FROM pmcids p
         LEFT JOIN rtrans r ON p.pmcid = r.pmcid
         LEFT JOIN oddpub o ON p.pmcid = o.pmcid
@@ -337,77 +504,204 @@ def load_data_with_duckdb(
     print(f"  rtrans matched: {rtrans_matched:,} ({100*rtrans_matched/merged_count:.1f}%)")
     print(f"  oddpub matched: {oddpub_matched:,} ({100*oddpub_matched/merged_count:.1f}%)")
 
-    # Convert to pandas for funder matching
-    export_start = log_time("Exporting to pandas...")
-    result_df = conn.execute("SELECT * FROM merged").df()
-    log_time(f"  Exported {len(result_df):,} records", export_start)
+    # The source tables are no longer needed; free them before exporting so
+    # DuckDB doesn't hold rtrans (with all funding text) alongside the export
+    for table in ('rtrans', 'oddpub', 'pmcids'):
+        conn.execute(f"DROP TABLE {table}")
 
-    conn.close()
     log_time("DuckDB data loading complete", start)
 
-    return result_df
+    return merged_count
+
+
+def stream_merged(
+    conn: duckdb.DuckDBPyConnection,
+    chunk_size: int,
+) -> Tuple[Iterator[pa.StringArray], List[pa.RecordBatch], List[np.ndarray], pa.Schema, int]:
+    """
+    Stream the merged table in Arrow record batches for Python funder matching.
+
+    Rows without funding text are fetched up front and never reach the
+    workers; they come first in records and get an empty funder list.
+
+    Returns tuple of (text_chunks, records, codes, schema, n_empty).
+    Iterating text_chunks yields the distinct funding texts of each
+    remaining batch as an Arrow array (identical acknowledgements are
+    common, so each is matched once per batch), and appends the batch's
+    other columns to records and its per-row text index to codes. Indices
+    count across all yielded texts starting at 1; 0 is the empty list of
+    the rows without text. Arrow arrays pickle as their raw buffers, so
+    workers receive a few memcpys per chunk instead of one pickled object
+    per string.
+    """
+    empty = conn.execute("""
+        SELECT * EXCLUDE (combined_funding) FROM merged
+        WHERE COALESCE(trim(combined_funding), '') = ''
+    """).to_arrow_table()
+    records = [dictionary_encode_batch(batch) for batch in empty.to_batches()]
+    codes = [np.zeros(empty.num_rows, dtype=np.int64)]
+
+    reader = conn.execute(
+        "SELECT * FROM merged WHERE trim(combined_funding) <> ''"
+    ).to_arrow_reader(chunk_size)
+    record_cols = [c for c in reader.schema.names if c != 'combined_funding']
+
+    def text_chunks():
+        offset = 1
+        for batch in reader:
+            records.append(dictionary_encode_batch(batch.select(record_cols)))
+            encoded = pc.dictionary_encode(batch.column('combined_funding'))
+            codes.append(encoded.indices.to_numpy().astype(np.int64) + offset)
+            offset += len(encoded.dictionary)
+            yield encoded.dictionary
+
+    return text_chunks(), records, codes, reader.schema, empty.num_rows
+
+
+def dictionary_encode_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Dictionary-encode the DICTIONARY_COLUMNS of a record batch."""
+    arrays = [
+        pc.dictionary_encode(column) if name in DICTIONARY_COLUMNS else column
+        for name, column in zip(batch.schema.names, batch.columns)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+
+def records_to_table(records: List[pa.RecordBatch], schema: pa.Schema) -> pa.Table:
+    """Combine the streamed record batches (without funding text) into one table."""
+    record_schema = pa.schema([
+        pa.field(f.name, pa.dictionary(pa.int32(), f.type)) if f.name in DICTIONARY_COLUMNS else f
+        for f in schema if f.name != 'combined_funding'
+    ])
+    return pa.Table.from_batches(records, schema=record_schema)
+
+
+def created_at_timestamp() -> str:
+    """Timestamp string stored in every record's created_at column."""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + '-04'
+
+
+def write_output_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    output_path: str,
+    patterns: Dict[str, str],
+    child_to_parent: Dict[str, str],
+) -> int:
+    """
+    Match funders and write the dashboard parquet entirely inside DuckDB.
+
+    Builds the same columns as build_final_output from the merged table and
+    writes them with COPY, so no row ever becomes a Python object.
+
+    Returns the number of records written.
+    """
+    start = log_time(f"Matching {len(patterns)} funders in DuckDB and building final output...")
+
+    matched_expr = funder_match_sql('combined_funding', patterns)
+    funder_expr = 'matched'
+    if child_to_parent:
+        # Map children to parents, then drop repeats keeping first-seen order;
+        # dedupe outside the subquery so the regexes run once per row
+        matched_expr = map_to_parents_sql(matched_expr, child_to_parent)
+        funder_expr = dedupe_list_sql('matched')
+
+    conn.execute(f"""
+        CREATE TEMP TABLE dashboard AS
+        SELECT
+            pmid,
+            journal,
+            affiliation_country,
+            is_open_data,
+            is_open_code,
+            year,
+            {funder_expr} as funder,
+            ['pmc_oa', COALESCE(license, 'unknown')] as data_tags,
+            ? as created_at
+        FROM (SELECT *, {matched_expr} as matched FROM merged)
+    """, [created_at_timestamp()])
+    conn.execute("DROP TABLE merged")
+
+    n_records, n_open_data, n_open_code, n_with_funder = conn.execute("""
+        SELECT
+            COUNT(*),
+            COUNT(*) FILTER (WHERE is_open_data),
+            COUNT(*) FILTER (WHERE is_open_code),
+            COUNT(*) FILTER (WHERE len(funder) > 0)
+        FROM dashboard
+    """).fetchone()
+
+    log_time(f"  Final dataset: {n_records:,} records", start)
+    print(f"  Open data: {n_open_data:,} ({100*n_open_data/max(n_records, 1):.2f}%)")
+    print(f"  Open code: {n_open_code:,} ({100*n_open_code/max(n_records, 1):.2f}%)")
+    print(f"  With funders: {n_with_funder:,} ({100*n_with_funder/max(n_records, 1):.2f}%)")
+
+    save_start = log_time(f"Saving to {output_path}...")
+    conn.execute(f"""
+        COPY (SELECT * FROM dashboard ORDER BY {', '.join(OUTPUT_SORT_COLUMNS)})
+        TO {sql_quote(output_path)}
+        (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE {OUTPUT_ROW_GROUP_SIZE},
+         KV_METADATA {{pandas: {sql_quote(OUTPUT_SCHEMA.metadata[b'pandas'].decode())}}})
+    """)
+    log_time("  Saved", save_start)
+
+    return n_records
 
 
-# Global variable for worker processes (loaded once per process)
+# Global variables for worker processes (loaded once per process)
 _worker_patterns = None
+_worker_hyperscan_prefilter = None
+_worker_literal_prefilter = None
 
 
-def _init_worker(patterns_dict: Dict[str, str]):
-    """Initialize worker process with compiled patterns."""
+def _init_worker(patterns_dict: Dict[str, str], variants: Dict[str, List[str]]):
+    """Compile patterns into the worker globals (runs once per worker process)."""
     global _worker_patterns
+    global _worker_hyperscan_prefilter, _worker_literal_prefilter
     # Recompile patterns in worker process
     _worker_patterns = {
         canonical: re.compile(pattern, re.IGNORECASE)
         for canonical, pattern in patterns_dict.items()
     }
+    # One-pass prefilter so each text only runs the patterns that can match
+    if HAS_HYPERSCAN:
+        _worker_hyperscan_prefilter = build_hyperscan_prefilter(variants)
+    elif HAS_AHOCORASICK and variants:
+        _worker_literal_prefilter = build_literal_prefilter(variants)
 
 
-def _match_funders_batch(texts: List[str]) -> List[List[str]]:
+def _match_funders_batch(texts: pa.StringArray) -> List[List[str]]:
     """Match funders for a batch of texts (runs in worker process)."""
-    global _worker_patterns
     results = []
-    for text in texts:
+    for text in texts.to_pylist():
         if pd.isna(text) or not text or text.strip() == '':
             results.append([])
         else:
-            text_str = str(text)
-            matched = [
-                canonical for canonical, pattern in _worker_patterns.items()
-                if pattern.search(text_str)
-            ]
-            results.append(matched)
+            results.append(scan_funders(
+                str(text), _worker_patterns, _worker_hyperscan_prefilter,
+                _worker_literal_prefilter
+            ))
     return results
 
 
-def build_funder_patterns(aliases_csv: Path) -> Dict[str, str]:
-    """Build regex pattern strings from funder aliases CSV."""
-    from funder_analysis.normalize_funders import FunderNormalizer
-    normalizer = FunderNormalizer(str(aliases_csv))
-
-    # Extract pattern strings (not compiled patterns, for serialization)
-    patterns = {}
-    for canonical in normalizer.get_all_canonical_names():
-        variants = normalizer.get_variants(canonical)
-        sorted_variants = sorted(variants, key=len, reverse=True)
-
-        pattern_parts = []
-        for variant in sorted_variants:
-            escaped = re.escape(variant)
-            if len(variant) <= 6 and variant.isupper():
-                pattern_parts.append(r'\b' + escaped + r'\b')
-            else:
-                pattern_parts.append(escaped)
+def build_funder_patterns(normalizer: FunderNormalizer) -> Dict[str, str]:
+    """Get regex pattern strings for each canonical funder."""
+    # Pattern strings (not compiled patterns, for serialization)
+    return {
+        canonical: pattern.pattern
+        for canonical, pattern in normalizer.search_patterns.items()
+    }
 
-        patterns[canonical] = '|'.join(pattern_parts)
 
-    return patterns
+def build_funder_variants(normalizer: FunderNormalizer) -> Dict[str, List[str]]:
+    """Get the variant strings of each canonical funder, in pattern order."""
+    return {
+        canonical: sorted(normalizer.get_variants(canonical))
+        for canonical in normalizer.search_patterns
+    }
 
 
-def build_child_to_parent_map(aliases_csv: Path) -> Dict[str, str]:
+def build_child_to_parent_map(normalizer: FunderNormalizer) -> Dict[str, str]:
     """Build a mapping of child funders to their parent funders."""
-    from funder_analysis.normalize_funders import FunderNormalizer
-    normalizer = FunderNormalizer(str(aliases_csv))
-
     child_to_parent = {}
     for canonical in normalizer.get_all_canonical_names():
         parent = normalizer.get_parent(canonical)
@@ -417,160 +711,228 @@ def build_child_to_parent_map(aliases_csv: Path) -> Dict[str, str]:
     return child_to_parent
 
 
-def aggregate_funders_in_lists(
-    funder_lists: List[List[str]],
-    child_to_parent: Dict[str, str],
-) -> List[List[str]]:
-    """
-    Aggregate child funders into parent funders for each article's funder list.
+def sql_quote(value: str) -> str:
+    """Quote a string as a SQL literal."""
+    return "'" + value.replace("'", "''") + "'"
 
-    For each article, if a child funder is found:
-    - Add the parent funder if not already present
-    - Remove the child funder from the list
 
-    Args:
-        funder_lists: List of funder lists (one per article)
-        child_to_parent: Dict mapping child funder names to parent names
+def funder_match_sql(column: str, patterns: Dict[str, str]) -> str:
+    """
+    Build a DuckDB expression listing the canonical funders whose pattern matches column.
 
-    Returns:
-        Modified funder lists with aggregation applied
+    Each pattern is a constant in the expression, so DuckDB compiles it once
+    (RE2, case-insensitive) rather than per row. Patterns come from
+    FunderNormalizer.re2_patterns, which match the same texts as the re
+    patterns. Names come out in patterns order, like scan_funders.
     """
-    aggregated_lists = []
-    for funders in funder_lists:
-        if not funders:
-            aggregated_lists.append([])
-            continue
+    if not patterns:
+        return "[]::VARCHAR[]"
+
+    cases = ',\n'.join(
+        f"CASE WHEN regexp_matches({column}, {sql_quote(pattern)}, 'i') THEN {sql_quote(canonical)} END"
+        for canonical, pattern in patterns.items()
+    )
+    return f"list_filter([{cases}], f -> f IS NOT NULL)"
+
+
+def map_to_parents_sql(column: str, child_to_parent: Dict[str, str]) -> str:
+    """Build a DuckDB expression replacing child funders in a list with their parents."""
+    parents = ', '.join(
+        f"{sql_quote(child)}: {sql_quote(parent)}" for child, parent in child_to_parent.items()
+    )
+    return f"list_transform({column}, f -> COALESCE(MAP {{{parents}}}[f], f))"
+
 
-        # Start with a set of funders for efficient lookup
-        funder_set = set(funders)
+def dedupe_list_sql(column: str) -> str:
+    """Build a DuckDB expression dropping repeats from a list, keeping first-seen order."""
+    return f"list_filter({column}, (f, i) -> list_position({column}, f) = i)"
 
-        # Add parent funders for any children found
-        for funder in list(funder_set):
-            parent = child_to_parent.get(funder)
-            if parent:
-                funder_set.add(parent)
-                funder_set.discard(funder)  # Remove child
 
-        aggregated_lists.append(list(funder_set))
+def funder_list_array(funder_lists: List[List[str]]) -> pa.ListArray:
+    """Build one Arrow list<string> array from per-article funder lists (offsets + flat values)."""
+    offsets = np.zeros(len(funder_lists) + 1, dtype=np.int32)
+    np.cumsum([len(f) for f in funder_lists], out=offsets[1:])
+    values = pa.array(list(chain.from_iterable(funder_lists)), type=pa.string())
+    return pa.ListArray.from_arrays(offsets, values)
+
+
+def aggregate_funders_duckdb(
+    conn: duckdb.DuckDBPyConnection,
+    funder: pa.ListArray,
+    child_to_parent: Dict[str, str],
+) -> pa.Array:
+    """
+    Aggregate child funders into parent funders for each article's funder list.
 
-    return aggregated_lists
+    Each child is replaced by its parent and repeats are dropped keeping
+    first-seen order, as a vectorized list transform in DuckDB (the same
+    expressions write_output_duckdb uses).
+    """
+    conn.register('funder_lists', pa.table({'row': np.arange(len(funder)), 'funder': funder}))
+    aggregated = conn.execute(f"""
+        SELECT {dedupe_list_sql('parents')} as funder
+        FROM (SELECT row, {map_to_parents_sql('funder', child_to_parent)} as parents FROM funder_lists)
+        ORDER BY row
+    """).to_arrow_table().column('funder')
+    conn.unregister('funder_lists')
+    return aggregated.combine_chunks()
 
 
 def match_funders_parallel(
-    texts: pd.Series,
+    text_chunks: Iterator[pa.StringArray],
     patterns: Dict[str, str],
+    variants: Dict[str, List[str]],
     num_workers: int,
-    chunk_size: int = 10000,
+    total_chunks: Optional[int] = None,
 ) -> List[List[str]]:
-    """Match funders in parallel across multiple processes."""
+    """
+    Match funders in parallel across multiple processes.
+
+    Chunks are pulled from text_chunks as workers free up, with at most
+    2 * num_workers chunks in flight, so matching overlaps with the export
+    and the texts are only held while they wait to be matched.
+    """
     start = log_time(f"Matching funders with {num_workers} workers...")
 
-    # Convert to list for easier chunking
-    text_list = texts.tolist()
-    n_total = len(text_list)
+    results = {}
+    chunk_sizes = {}
+    pending = {}
+    max_in_flight = 2 * num_workers
+    completed = 0
 
-    # Create chunks
-    chunks = [
-        text_list[i:i + chunk_size]
-        for i in range(0, n_total, chunk_size)
-    ]
-    log_time(f"  Split into {len(chunks)} chunks of up to {chunk_size}")
-
-    results = [None] * len(chunks)
-
-    with ProcessPoolExecutor(
-        max_workers=num_workers,
-        initializer=_init_worker,
-        initargs=(patterns,)
-    ) as executor:
-        # Submit all tasks
-        future_to_idx = {
-            executor.submit(_match_funders_batch, chunk): i
-            for i, chunk in enumerate(chunks)
-        }
-
-        # Collect results with progress
-        if HAS_TQDM:
-            iterator = tqdm(
-                as_completed(future_to_idx),
-                total=len(chunks),
-                desc="  Matching funders",
-                unit="chunk"
-            )
-        else:
-            iterator = as_completed(future_to_idx)
-            completed = 0
+    if HAS_TQDM:
+        progress = tqdm(total=total_chunks, desc="  Matching funders", unit="chunk")
 
-        for future in iterator:
-            idx = future_to_idx[future]
+    def collect(done):
+        nonlocal completed
+        for future in done:
+            idx = pending.pop(future)
             try:
                 results[idx] = future.result()
             except Exception as e:
                 print(f"    Warning: Chunk {idx} failed: {e}")
-                results[idx] = [[] for _ in chunks[idx]]
+                results[idx] = [[] for _ in range(chunk_sizes[idx])]
+
+            completed += 1
+            if HAS_TQDM:
+                progress.update(1)
+            elif completed % 10 == 0 or completed == total_chunks:
+                of_total = f"/{total_chunks}" if total_chunks else ""
+                print(f"    Progress: {completed}{of_total} chunks")
+
+    # The parent's DuckDB connection has live threads streaming text_chunks,
+    # so never fork it: start workers from a forkserver (or spawn) and let
+    # each compile the patterns in the initializer
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context('forkserver')
+    else:
+        mp_context = multiprocessing.get_context('spawn')
 
-            if not HAS_TQDM:
-                completed += 1
-                if completed % 10 == 0 or completed == len(chunks):
-                    pct = 100 * completed / len(chunks)
-                    print(f"    Progress: {completed}/{len(chunks)} chunks ({pct:.1f}%)")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=(patterns, variants)) as executor:
+        for idx, chunk in enumerate(text_chunks):
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            chunk_sizes[idx] = len(chunk)
+            pending[executor.submit(_match_funders_batch, chunk)] = idx
 
-    # Flatten results
+        done, _ = wait(pending)
+        collect(done)
+
+    if HAS_TQDM:
+        progress.close()
+
+    # Flatten results in chunk order
     all_funders = []
-    for chunk_result in results:
-        all_funders.extend(chunk_result)
+    for idx in range(len(results)):
+        all_funders.extend(results[idx])
 
-    log_time(f"  Matched funders for {len(all_funders):,} records", start)
+    log_time(f"  Matched funders for {len(all_funders):,} distinct texts in {len(results)} chunks", start)
 
     # Count stats
     has_funder = sum(1 for f in all_funders if f)
-    log_time(f"  Records with funders: {has_funder:,} ({100*has_funder/len(all_funders):.2f}%)")
+    log_time(f"  Texts with funders: {has_funder:,} ({100*has_funder/max(len(all_funders), 1):.2f}%)")
 
     return all_funders
 
 
 def build_final_output(
-    df: pd.DataFrame,
-    funder_lists: List[List[str]],
-) -> pd.DataFrame:
-    """Build final output DataFrame with correct schema."""
-    start = log_time("Building final output...")
-
-    # Add funder arrays
-    df['funder'] = [np.array(f, dtype=object) for f in funder_lists]
-
-    # Build data_tags
-    df['data_tags'] = df['license'].apply(
-        lambda lic: np.array(['pmc_oa', lic if pd.notna(lic) else 'unknown'], dtype=object)
+    records: pa.Table,
+    funder: pa.Array,
+    created_at: str,
+) -> pa.Table:
+    """Build output rows with the dashboard schema."""
+    n_records = records.num_rows
+
+    # Build data_tags - ['pmc_oa', license] per row, interleaved from two columns
+    licenses = pc.fill_null(records.column('license').cast(pa.string()).combine_chunks(), 'unknown')
+    tag_values = pa.concat_arrays([pa.repeat('pmc_oa', n_records), licenses])
+    interleave = np.arange(2 * n_records).reshape(2, n_records).T.ravel()
+    data_tags = pa.ListArray.from_arrays(
+        np.arange(0, 2 * n_records + 1, 2, dtype=np.int32), tag_values.take(interleave)
     )
 
-    # Add created_at timestamp
-    df['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3] + '-04'
-
-    # Select final columns in correct order
-    final_columns = [
-        'pmid', 'journal', 'affiliation_country',
-        'is_open_data', 'is_open_code', 'year',
-        'funder', 'data_tags', 'created_at'
-    ]
+    columns = {
+        'funder': funder.cast(OUTPUT_SCHEMA.field('funder').type),
+        'data_tags': data_tags,
+        'created_at': pa.repeat(created_at, n_records),
+    }
+    for field in OUTPUT_SCHEMA:
+        if field.name in columns:
+            continue
+        if field.name in records.column_names:
+            columns[field.name] = records.column(field.name).cast(field.type)
+        else:
+            columns[field.name] = pa.nulls(n_records, field.type)
 
-    for col in final_columns:
-        if col not in df.columns:
-            df[col] = None
+    return pa.table([columns[f.name] for f in OUTPUT_SCHEMA], schema=OUTPUT_SCHEMA)
 
-    result = df[final_columns].copy()
 
-    # Convert pmid to int64 (with NaN handling)
-    result['pmid'] = pd.to_numeric(result['pmid'], errors='coerce').astype('Int64')
+def write_output_python(output_path: str, records: pa.Table, funder: pa.Array) -> int:
+    """
+    Write the Python-matched dashboard parquet one row group at a time.
 
-    log_time(f"  Final dataset: {len(result):,} records", start)
-    print(f"  Open data: {result['is_open_data'].sum():,} ({100*result['is_open_data'].mean():.2f}%)")
-    print(f"  Open code: {result['is_open_code'].sum():,} ({100*result['is_open_code'].mean():.2f}%)")
+    Sort indices are computed once over the whole table; each row group is
+    gathered with take and built by build_final_output, so only one output
+    row group is materialized on top of the inputs.
 
-    has_funder = result['funder'].apply(lambda x: len(x) > 0 if isinstance(x, np.ndarray) else False)
-    print(f"  With funders: {has_funder.sum():,} ({100*has_funder.mean():.2f}%)")
+    Returns the number of records written.
+    """
+    start = log_time("Building final output...")
+    n_records = records.num_rows
+
+    n_open_data = pc.sum(records.column('is_open_data')).as_py() or 0
+    n_open_code = pc.sum(records.column('is_open_code')).as_py() or 0
+    n_with_funder = pc.sum(pc.greater(pc.list_value_length(funder), 0)).as_py() or 0
+
+    log_time(f"  Final dataset: {n_records:,} records", start)
+    print(f"  Open data: {n_open_data:,} ({100*n_open_data/max(n_records, 1):.2f}%)")
+    print(f"  Open code: {n_open_code:,} ({100*n_open_code/max(n_records, 1):.2f}%)")
+    print(f"  With funders: {n_with_funder:,} ({100*n_with_funder/max(n_records, 1):.2f}%)")
+
+    # Dictionary encoding covers the repeated journal, country, funder and tag strings
+    save_start = log_time(f"Saving to {output_path}...")
+    # Arrow cannot sort on dictionary columns, so decode just the sort keys
+    sort_keys = pa.table({
+        c: records.column(c).cast(OUTPUT_SCHEMA.field(c).type) for c in OUTPUT_SORT_COLUMNS
+    })
+    order = pc.sort_indices(
+        sort_keys,
+        sort_keys=[(c, 'ascending', 'at_end') for c in OUTPUT_SORT_COLUMNS],
+    )
+    created_at = created_at_timestamp()
+    with pq.ParquetWriter(output_path, OUTPUT_SCHEMA, compression='zstd', compression_level=3,
+                          use_dictionary=True, write_statistics=True) as writer:
+        for offset in range(0, n_records, OUTPUT_ROW_GROUP_SIZE):
+            rows = order.slice(offset, OUTPUT_ROW_GROUP_SIZE)
+            writer.write_table(
+                build_final_output(records.take(rows), funder.take(rows), created_at),
+                row_group_size=OUTPUT_ROW_GROUP_SIZE,
+            )
+    log_time("  Saved", save_start)
 
-    return result
+    return n_records
 
 
 def main():
@@ -597,26 +959,21 @@ def main():
     print(f"  Licenses: {licenses}")
     print(f"  Funder aliases: {funder_aliases_display}")
     print(f"  Aggregate children: {args.aggregate_children}")
+    print(f"  Funder matching: {args.funder_matching}")
     print(f"  Output: {args.output}")
     if args.limit:
         print(f"  Limit: {args.limit:,} PMCIDs (testing mode)")
     if args.threads:
         print(f"  DuckDB threads: {args.threads}")
+    if args.memory_limit:
+        print(f"  DuckDB memory limit: {args.memory_limit}")
+    if args.db_path:
+        print(f"  DuckDB cache: {args.db_path}{' (refresh)' if args.refresh_db else ''}")
     print()
 
     # Validate output directory before starting expensive operations
     validate_output_directory(args.output)
 
-    # Load and join data using DuckDB
-    df = load_data_with_duckdb(
-        args.filelist_dir,
-        args.rtrans_dir,
-        args.oddpub_file,
-        licenses,
-        args.limit,
-        args.threads,
-    )
-
     # Build funder patterns
     if args.funder_aliases:
         aliases_csv = Path(args.funder_aliases)
@@ -624,54 +981,96 @@ def main():
         # Default to v3 funder aliases
         aliases_csv = Path(__file__).parent.parent / 'funder_analysis' / 'funder_aliases_v3.csv'
 
+    # Load the aliases once; patterns and parent mapping both come from it
     if aliases_csv.exists():
-        patterns = build_funder_patterns(aliases_csv)
+        normalizer = FunderNormalizer(str(aliases_csv))
+        patterns = build_funder_patterns(normalizer)
+        variants = build_funder_variants(normalizer)
+        re2_patterns = dict(normalizer.re2_patterns)
         log_time(f"Loaded {len(patterns)} canonical funder patterns from {aliases_csv}")
     else:
         log_time(f"Warning: Funder aliases file not found at {aliases_csv}")
+        normalizer = None
         patterns = {}
+        variants = {}
+        re2_patterns = {}
+
+    # Parent mapping for aggregating children into parents, if requested
+    child_to_parent = {}
+    if args.aggregate_children and normalizer is not None:
+        child_to_parent = build_child_to_parent_map(normalizer)
+        if child_to_parent:
+            log_time(f"Found {len(child_to_parent)} child->parent relationships")
+            if args.verbose:
+                print('\n'.join(f"    {child} -> {parent}" for child, parent in sorted(child_to_parent.items())))
+        else:
+            log_time("No parent-child relationships found, skipping aggregation")
 
-    # Match funders in parallel
-    funder_lists = match_funders_parallel(
-        df['combined_funding'],
-        patterns,
-        num_workers,
-        args.chunk_size
+    # Load and join data using DuckDB
+    conn = connect_duckdb(args.db_path, args.threads, args.memory_limit, args.temp_dir)
+    merged_count = load_data_with_duckdb(
+        conn,
+        args.filelist_dir,
+        args.rtrans_dir,
+        args.oddpub_file,
+        licenses,
+        args.limit,
+        cache_sources=bool(args.db_path),
+        refresh_db=args.refresh_db,
     )
 
-    # Aggregate children into parents if requested
-    if args.aggregate_children and aliases_csv.exists():
-        agg_start = log_time("Aggregating child funders into parents...")
-        child_to_parent = build_child_to_parent_map(aliases_csv)
+    if args.funder_matching == 'duckdb':
+        # Match, aggregate and write without leaving DuckDB
+        n_records = write_output_duckdb(conn, args.output, re2_patterns, child_to_parent)
+        conn.close()
+    else:
+        # Match funders in parallel while streaming the merged table out of DuckDB
+        # Fewer, larger chunks amortize the per-chunk pickling and IPC
+        chunk_size = max(args.chunk_size, math.ceil(merged_count / (num_workers * 4)))
+        log_time(f"Streaming merged records in chunks of up to {chunk_size:,}...")
+        text_chunks, records, codes, schema, n_empty = stream_merged(conn, chunk_size)
+        log_time(f"  Skipping {n_empty:,} records without funding text")
+        funder_lists = [[]]
+        funder_lists.extend(match_funders_parallel(
+            text_chunks,
+            patterns,
+            variants,
+            num_workers,
+            total_chunks=math.ceil((merged_count - n_empty) / chunk_size),
+        ))
+        records = records_to_table(records, schema)
+        # Scatter the per-text funder lists back to rows
+        funder = funder_list_array(funder_lists).take(pa.array(np.concatenate(codes)))
+        del funder_lists, codes
+
+        # Aggregate children into parents if requested
         if child_to_parent:
-            log_time(f"  Found {len(child_to_parent)} child->parent relationships")
-            for child, parent in sorted(child_to_parent.items()):
-                log_time(f"    {child} -> {parent}")
-            funder_lists = aggregate_funders_in_lists(funder_lists, child_to_parent)
+            agg_start = log_time("Aggregating child funders into parents...")
+            funder = aggregate_funders_duckdb(conn, funder, child_to_parent)
             log_time("  Aggregation complete", agg_start)
-        else:
-            log_time("  No parent-child relationships found, skipping aggregation")
+        conn.close()
 
-    # Build final output
-    result = build_final_output(df, funder_lists)
+        # Build and write the output
+        n_records = write_output_python(args.output, records, funder)
 
-    # Save output
-    save_start = log_time(f"Saving to {args.output}...")
-    result.to_parquet(args.output, index=False)
     file_size = os.path.getsize(args.output) / (1024 * 1024)
-    log_time(f"  Saved {file_size:.1f} MB", save_start)
+    log_time(f"  Output size: {file_size:.1f} MB")
 
-    # Verify output
-    verify = pd.read_parquet(args.output)
-    log_time(f"Verification: {len(verify):,} records, {len(verify.columns)} columns")
-    print(f"  Columns: {verify.columns.tolist()}")
+    # Verify output from the parquet footer (no need to decode the data)
+    written = pq.ParquetFile(args.output)
+    verify = written.metadata
+    log_time(f"Verification: {verify.num_rows:,} records, {verify.num_columns} columns, "
+             f"{verify.num_row_groups} row groups")
+    print(f"  Columns: {written.schema_arrow.names}")
+    if verify.num_rows != n_records:
+        raise ValueError(f"Output has {verify.num_rows:,} records, expected {n_records:,}")
 
     # Summary
     total_elapsed = time.time() - total_start
     print()
     print("=" * 70)
     print(f"COMPLETE in {total_elapsed/60:.1f} minutes ({total_elapsed:.0f} seconds)")
-    print(f"  Records: {len(result):,}")
+    print(f"  Records: {n_records:,}")
     print(f"  Output: {args.output}")
     print(f"  Size: {file_size:.1f} MB")
     print("=" * 70)
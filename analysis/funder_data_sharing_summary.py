@@ -31,19 +31,28 @@ Updated: 2025-12-08 - Added v3 funder aliases with parent-child aggregation
 """
 
 import argparse
-import gc
 import glob
 import logging
+import re
 import sys
-from collections import defaultdict
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import cpu_count
 from pathlib import Path
 
 import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from funder_analysis.normalize_funders import FunderNormalizer
+from funder_analysis.normalize_funders import (
+    HAS_AHOCORASICK, HAS_HYPERSCAN, FunderNormalizer, build_literal_prefilter,
+    build_hyperscan_prefilter, scan_funders
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -61,6 +70,15 @@ ALLOWED_ARTICLE_TYPES = (
     'other',
 )
 
+FUNDING_COLS = ['fund_text', 'fund_pmc_institute', 'fund_pmc_source', 'fund_pmc_anysource']
+YEAR_COLS = ['year_epub', 'year_ppub']
+
+# Rows per record batch when streaming rtrans parquet files (shared with
+# openss_funder_trends.py). Each batch is joined and its funding text held
+# as Python strings, so peak memory grows with it: 128k rows of ~1KB text
+# took about 180 MB more per worker than 64k, for no measurable speedup
+BATCH_SIZE = 64_000
+
 
 def aggregate_children_to_parents(counts: dict, normalizer: FunderNormalizer) -> dict:
     """
@@ -107,43 +125,145 @@ def aggregate_children_to_parents(counts: dict, normalizer: FunderNormalizer) ->
     return aggregated
 
 
-def normalize_pmcid(pmcid: str) -> str:
-    """Normalize PMCID to PMC######### format."""
-    if pd.isna(pmcid):
-        return None
-    pmcid = str(pmcid).strip().upper()
-    if pmcid.startswith('PMCPMC'):
-        pmcid = pmcid[3:]
-    if pmcid.endswith('.TXT'):
-        pmcid = pmcid[:-4]
-    if not pmcid.startswith('PMC'):
-        pmcid = 'PMC' + pmcid
-    return pmcid
+def normalize_pmcid_array(pmcids) -> pa.ChunkedArray:
+    """Normalize an Arrow array of PMCIDs to PMC######### format (nulls stay null)."""
+    ids = pc.utf8_upper(pc.utf8_trim_whitespace(pmcids.cast(pa.string())))
+    ids = pc.if_else(pc.starts_with(ids, 'PMCPMC'), pc.utf8_slice_codeunits(ids, 3), ids)
+    ids = pc.if_else(pc.ends_with(ids, '.TXT'), pc.utf8_slice_codeunits(ids, 0, -4), ids)
+    return pc.if_else(pc.starts_with(ids, 'PMC'), ids, pc.utf8_replace_slice(ids, 0, 0, 'PMC'))
+
+
+# Per-process state for worker processes (set once by _init_worker)
+_worker_con = None
+_worker_patterns = None
+_worker_hyperscan_prefilter = None
+_worker_literal_prefilter = None
+_worker_year_range = None
+
+
+def _init_worker(lookup_db: str, patterns: dict, variants: dict, year_range: tuple):
+    """Initialize worker process with lookup tables and funder patterns."""
+    global _worker_con, _worker_patterns, _worker_year_range
+    global _worker_hyperscan_prefilter, _worker_literal_prefilter
+    # Workers already run in parallel, so keep each DuckDB connection single-threaded
+    _worker_con = duckdb.connect(':memory:', config={'threads': 1})
+    _worker_con.execute(f"ATTACH '{lookup_db}' AS lookup (READ_ONLY)")
+    _worker_patterns = {
+        funder: re.compile(pattern, re.IGNORECASE)
+        for funder, pattern in patterns.items()
+    }
+    if HAS_HYPERSCAN:
+        _worker_hyperscan_prefilter = build_hyperscan_prefilter(variants)
+    elif HAS_AHOCORASICK:
+        _worker_literal_prefilter = build_literal_prefilter(variants)
+    _worker_year_range = year_range
+
+
+def _count_funders_in_batch(batch: pa.Table, corpus_counts: Counter, open_data_counts: Counter) -> tuple:
+    """
+    Count funders in one batch of rtrans rows (with pmcid_norm), updating the counters in place.
 
+    Returns tuple of (corpus_total, open_data_total) for the batch
+    """
+    min_year, max_year = _worker_year_range
+    con = _worker_con
+
+    year_cols = [c for c in YEAR_COLS if c in batch.column_names]
+    if not year_cols:
+        return 0, 0
+
+    # Get year - prefer epub, fallback to ppub (non-numeric values become NULL)
+    year_expr = 'COALESCE(' + ', '.join(f'TRY_CAST(r.{c} AS DOUBLE)' for c in year_cols) + ')'
+
+    # Register the Arrow batch in DuckDB (no pandas conversion)
+    con.register('rtrans_batch', batch)
+
+    # Filter to the year range and allowed article types, and mark open data
+    # articles, in one query so DuckDB plans both joins together
+    with_open_data = con.execute(f"""
+        SELECT r.*, (o.pmcid IS NOT NULL) as has_open_data
+        FROM rtrans_batch r
+        INNER JOIN lookup.article_types a ON r.pmcid_norm = a.pmcid
+        LEFT JOIN lookup.open_data_pmcids o ON r.pmcid_norm = o.pmcid
+        WHERE trunc({year_expr}) BETWEEN ? AND ?
+    """, [min_year, max_year]).to_arrow_table()
+    con.unregister('rtrans_batch')
+
+    corpus_total = with_open_data.num_rows
+    if corpus_total == 0:
+        return 0, 0
+
+    open_data_total = pc.sum(with_open_data['has_open_data']).as_py() or 0
+
+    # Get available funding columns
+    available_cols = [c for c in FUNDING_COLS if c in with_open_data.column_names]
+    if not available_cols:
+        return corpus_total, open_data_total
+
+    # Combine all funding text in one Arrow kernel (nulls become empty strings)
+    combined_fund = pc.binary_join_element_wise(
+        *[with_open_data[col].cast(pa.string()) for col in available_cols], ' ',
+        null_handling='replace', null_replacement=''
+    )
 
-def count_funders_duckdb(rtrans_dir: Path,
-                          oddpub_file: Path,
-                          registry_path: Path,
-                          normalizer: FunderNormalizer,
-                          year_range: tuple = (2010, 2024),
-                          limit: int = None) -> tuple:
+    # Scan each article's funding text once for all canonical funders
+    texts = combined_fund.to_pylist()
+    has_open_data = with_open_data['has_open_data'].to_pylist()
+    for text, is_open in zip(texts, has_open_data):
+        funders = scan_funders(text, _worker_patterns, _worker_hyperscan_prefilter,
+                               _worker_literal_prefilter)
+        if funders:
+            corpus_counts.update(funders)
+            if is_open:
+                open_data_counts.update(funders)
+
+    return corpus_total, open_data_total
+
+
+def _count_funders_in_file(pf: str) -> tuple:
     """
-    Count funders using DuckDB for memory-efficient processing.
+    Count funders in a single rtrans parquet file (runs in worker process).
 
-    Returns tuple of (corpus_counts, open_data_counts)
+    The file is streamed in record batches restricted to the PMCID, year and
+    funding columns, so peak memory is bounded by BATCH_SIZE rather than by
+    the size of the file.
+
+    Returns tuple of (corpus_total, open_data_total, corpus_counts, open_data_counts)
     """
-    min_year, max_year = year_range
-    all_funders = normalizer.get_all_canonical_names()
+    corpus_counts = Counter()
+    open_data_counts = Counter()
+    corpus_total = 0
+    open_data_total = 0
 
-    logger.info(f"Searching for {len(all_funders)} canonical funders")
-    logger.info(f"Year range: {min_year}-{max_year}")
+    parquet_file = pq.ParquetFile(pf)
+    schema_cols = set(parquet_file.schema_arrow.names)
 
-    # Initialize counts
-    corpus_counts = {funder: 0 for funder in all_funders}
-    open_data_counts = {funder: 0 for funder in all_funders}
+    if 'pmcid_pmc' in schema_cols:
+        id_col = 'pmcid_pmc'
+    elif 'pmcid' in schema_cols:
+        id_col = 'pmcid'
+    else:
+        return 0, 0, corpus_counts, open_data_counts
 
-    # Create in-memory DuckDB for efficient joins
-    con = duckdb.connect(':memory:')
+    columns = [id_col] + [c for c in YEAR_COLS + FUNDING_COLS if c in schema_cols]
+
+    for batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=columns):
+        table = pa.Table.from_batches([batch])
+        table = table.append_column('pmcid_norm', normalize_pmcid_array(batch.column(id_col)))
+        batch_corpus, batch_open_data = _count_funders_in_batch(table, corpus_counts, open_data_counts)
+        corpus_total += batch_corpus
+        open_data_total += batch_open_data
+
+    return corpus_total, open_data_total, corpus_counts, open_data_counts
+
+
+def build_lookup_db(lookup_db: str, registry_path: Path, oddpub_file: Path) -> None:
+    """
+    Build the lookup tables (allowed article types, open data PMCIDs) into lookup_db.
+
+    Workers attach the file read-only to filter and flag each rtrans batch.
+    """
+    con = duckdb.connect(lookup_db)
 
     # Load article types from registry (using SQL for efficiency)
     logger.info(f"Loading article types from registry...")
@@ -165,124 +285,145 @@ def count_funders_duckdb(rtrans_dir: Path,
 
     # Load open data PMCIDs
     logger.info(f"Loading open data PMCIDs from {oddpub_file}")
+    # Article names look like PMCPMC544856.txt; normalize them with plain
+    # string functions (same rules as normalize_pmcid_array)
     con.execute(f"""
         CREATE TABLE open_data_pmcids AS
         SELECT DISTINCT
             CASE
                 WHEN pmcid IS NOT NULL THEN UPPER(TRIM(pmcid))
-                WHEN article IS NOT NULL THEN
-                    CASE
-                        WHEN UPPER(article) LIKE 'PMCPMC%' THEN SUBSTR(UPPER(article), 4)
-                        WHEN UPPER(article) LIKE 'PMC%' THEN UPPER(article)
-                        ELSE 'PMC' || UPPER(article)
-                    END
+                WHEN article_id LIKE 'PMC%' THEN article_id
+                WHEN article_id IS NOT NULL THEN 'PMC' || article_id
                 ELSE NULL
             END as pmcid
-        FROM read_parquet('{oddpub_file}')
-        WHERE is_open_data = true
+        FROM (
+            SELECT
+                pmcid,
+                CASE
+                    WHEN art LIKE 'PMCPMC%' AND art LIKE '%.TXT' THEN SUBSTR(art, 4, LENGTH(art) - 7)
+                    WHEN art LIKE 'PMCPMC%' THEN SUBSTR(art, 4)
+                    WHEN art LIKE '%.TXT' THEN LEFT(art, LENGTH(art) - 4)
+                    ELSE art
+                END as article_id
+            FROM (
+                SELECT pmcid, UPPER(TRIM(article)) as art
+                FROM read_parquet('{oddpub_file}')
+                WHERE is_open_data = true
+            )
+        )
     """)
     open_data_count = con.execute("SELECT COUNT(*) FROM open_data_pmcids WHERE pmcid IS NOT NULL").fetchone()
     logger.info(f"Loaded {open_data_count[0]:,} open data PMCIDs")
+    con.close()
 
-    # Process rtrans files in batches
-    parquet_files = sorted(glob.glob(f'{rtrans_dir}/*.parquet'))
-    if limit:
-        parquet_files = parquet_files[:limit]
-        logger.info(f"Limited to first {limit} files for testing")
-
-    logger.info(f"Processing {len(parquet_files)} rtrans parquet files")
-
-    funding_cols = ['fund_text', 'fund_pmc_institute', 'fund_pmc_source', 'fund_pmc_anysource']
 
-    total_corpus = 0
-    total_open_data = 0
+def count_rtrans_files(parquet_files: list, num_workers: int, initargs: tuple):
+    """
+    Yield (file, counts) for each rtrans file, as returned by _count_funders_in_file.
 
-    for i, pf in enumerate(parquet_files):
+    Files are counted in a process pool, or in this process when there is a
+    single worker or file, which skips starting the pool and pickling its
+    results. A file that fails yields its exception in place of the counts.
+    """
+    if num_workers <= 1 or len(parquet_files) <= 1:
+        _init_worker(*initargs)
         try:
-            # Load rtrans file
-            df = pd.read_parquet(pf)
-
-            # Normalize PMCID
-            if 'pmcid_pmc' in df.columns:
-                df['pmcid_norm'] = df['pmcid_pmc'].apply(normalize_pmcid)
-            elif 'pmcid' in df.columns:
-                df['pmcid_norm'] = df['pmcid'].apply(normalize_pmcid)
-            else:
-                continue
+            for pf in parquet_files:
+                try:
+                    yield pf, _count_funders_in_file(pf)
+                except Exception as e:
+                    yield pf, e
+        finally:
+            _worker_con.close()
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=initargs
+    ) as executor:
+        future_to_file = {
+            executor.submit(_count_funders_in_file, pf): pf
+            for pf in parquet_files
+        }
+        for future in as_completed(future_to_file):
+            pf = future_to_file[future]
+            try:
+                yield pf, future.result()
+            except Exception as e:
+                yield pf, e
 
-            # Get year - prefer epub, fallback to ppub
-            df['year'] = pd.Series([None] * len(df), dtype='float64')
-            for yc in ['year_epub', 'year_ppub']:
-                if yc in df.columns:
-                    year_vals = pd.to_numeric(df[yc], errors='coerce')
-                    df['year'] = df['year'].combine_first(year_vals)
 
-            df = df[df['year'].notna()]
-            df['year'] = df['year'].astype(int)
-            df = df[(df['year'] >= min_year) & (df['year'] <= max_year)]
-
-            if len(df) == 0:
-                continue
+def count_funders_duckdb(rtrans_dir: Path,
+                          oddpub_file: Path,
+                          registry_path: Path,
+                          normalizer: FunderNormalizer,
+                          year_range: tuple = (2010, 2024),
+                          limit: int = None,
+                          workers: int = None) -> tuple:
+    """
+    Count funders using DuckDB for memory-efficient processing.
 
-            # Register DataFrame in DuckDB
-            con.register('rtrans_batch', df)
+    Lookup tables (allowed article types, open data PMCIDs) are built once
+    into a temporary DuckDB file that worker processes attach read-only;
+    rtrans files are then counted (in parallel with more than one worker)
+    and the per-file counts summed.
 
-            # Join with article_types (filter to allowed types)
-            filtered_df = con.execute("""
-                SELECT r.*
-                FROM rtrans_batch r
-                INNER JOIN article_types a ON r.pmcid_norm = a.pmcid
-            """).fetchdf()
+    Returns tuple of (corpus_counts, open_data_counts)
+    """
+    min_year, max_year = year_range
+    all_funders = normalizer.get_all_canonical_names()
 
-            if len(filtered_df) == 0:
-                con.unregister('rtrans_batch')
-                continue
+    logger.info(f"Searching for {len(all_funders)} canonical funders")
+    logger.info(f"Year range: {min_year}-{max_year}")
 
-            total_corpus += len(filtered_df)
+    # Initialize counts
+    corpus_counts = {funder: 0 for funder in all_funders}
+    open_data_counts = {funder: 0 for funder in all_funders}
 
-            # Mark open data articles
-            con.register('filtered_batch', filtered_df)
-            with_open_data = con.execute("""
-                SELECT f.*, (o.pmcid IS NOT NULL) as has_open_data
-                FROM filtered_batch f
-                LEFT JOIN open_data_pmcids o ON f.pmcid_norm = o.pmcid
-            """).fetchdf()
-            con.unregister('filtered_batch')
-            con.unregister('rtrans_batch')
+    # Pattern strings (not compiled patterns) for shipping to workers
+    patterns = {
+        funder: normalizer.search_patterns[funder].pattern
+        for funder in all_funders
+        if funder in normalizer.search_patterns
+    }
+    variants = {funder: sorted(normalizer.get_variants(funder)) for funder in patterns}
 
-            total_open_data += with_open_data['has_open_data'].sum()
+    parquet_files = sorted(glob.glob(f'{rtrans_dir}/*.parquet'))
+    if limit:
+        parquet_files = parquet_files[:limit]
+        logger.info(f"Limited to first {limit} files for testing")
 
-            # Get available funding columns
-            available_cols = [c for c in funding_cols if c in with_open_data.columns]
-            if not available_cols:
-                continue
+    num_workers = workers or cpu_count()
+    logger.info(f"Processing {len(parquet_files)} rtrans parquet files with {num_workers} workers")
 
-            # Combine all funding text
-            with_open_data['combined_fund'] = ''
-            for col in available_cols:
-                with_open_data['combined_fund'] = with_open_data['combined_fund'] + ' ' + with_open_data[col].fillna('').astype(str)
+    total_corpus = 0
+    total_open_data = 0
 
-            # For each canonical funder, count matches
-            for funder in all_funders:
-                pattern = normalizer.search_patterns.get(funder)
-                if pattern:
-                    matches = with_open_data['combined_fund'].str.contains(
-                        pattern.pattern, case=False, na=False, regex=True
-                    )
-                    corpus_counts[funder] += matches.sum()
-                    open_data_counts[funder] += (matches & with_open_data['has_open_data']).sum()
+    # Lookup tables live in an on-disk DuckDB shared by all workers, removed
+    # on the way out even if counting fails
+    with tempfile.TemporaryDirectory(prefix='funder_summary_') as tmp_dir:
+        lookup_db = str(Path(tmp_dir) / 'lookup.duckdb')
+        build_lookup_db(lookup_db, registry_path, oddpub_file)
+
+        file_counts = count_rtrans_files(parquet_files, num_workers,
+                                         (lookup_db, patterns, variants, year_range))
+        for i, (pf, result) in enumerate(file_counts):
+            if isinstance(result, Exception):
+                logger.warning(f"Error processing {Path(pf).name}: {result}")
+                continue
 
-            del df, filtered_df, with_open_data
-            gc.collect()
+            file_corpus, file_open_data, file_corpus_counts, file_open_counts = result
+            total_corpus += file_corpus
+            total_open_data += file_open_data
+            for funder, count in file_corpus_counts.items():
+                corpus_counts[funder] += count
+            for funder, count in file_open_counts.items():
+                open_data_counts[funder] += count
 
             if (i + 1) % 100 == 0:
                 logger.info(f"  Processed {i+1}/{len(parquet_files)} files, corpus: {total_corpus:,}, open_data: {total_open_data:,}")
 
-        except Exception as e:
-            logger.warning(f"Error processing {Path(pf).name}: {e}")
-
-    con.close()
-
     logger.info(f"Finished processing {len(parquet_files)} files")
     logger.info(f"Total corpus (filtered): {total_corpus:,}")
     logger.info(f"Total open data: {total_open_data:,}")
@@ -314,6 +455,8 @@ def main():
                         help='Path to funder_aliases CSV (default: funder_analysis/funder_aliases.csv)')
     parser.add_argument('--aggregate-children', action='store_true',
                         help='Aggregate child funder counts into parent totals (requires v3 aliases)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Number of parallel workers for rtrans files (default: CPU count = {cpu_count()})')
 
     args = parser.parse_args()
 
@@ -338,7 +481,8 @@ def main():
         args.registry,
         normalizer,
         tuple(args.year_range),
-        args.limit
+        args.limit,
+        args.workers
     )
 
     # Aggregate children into parents if requested
@@ -347,25 +491,24 @@ def main():
         corpus_counts = aggregate_children_to_parents(corpus_counts, normalizer)
         open_data_counts = aggregate_children_to_parents(open_data_counts, normalizer)
 
-    # Build results dataframe
-    results = []
-    funders_to_process = corpus_counts.keys()
-    for funder in funders_to_process:
-        total = corpus_counts[funder]
-        data_sharing = open_data_counts[funder]
-        pct = (data_sharing / total * 100) if total > 0 else 0.0
-
-        results.append({
-            'funder': funder,
-            'total_pubs': total,
-            'data_sharing_pubs': data_sharing,
-            'data_sharing_pct': round(pct, 2)
-        })
-
-    df = pd.DataFrame(results)
+    # Build results dataframe column by column
+    funders = list(corpus_counts.keys())
+    total_pubs = [corpus_counts[funder] for funder in funders]
+    data_sharing_pubs = [open_data_counts[funder] for funder in funders]
+    data_sharing_pct = [
+        round(data_sharing / total * 100, 2) if total > 0 else 0.0
+        for data_sharing, total in zip(data_sharing_pubs, total_pubs)
+    ]
+
+    df = pd.DataFrame({
+        'funder': funders,
+        'total_pubs': total_pubs,
+        'data_sharing_pubs': data_sharing_pubs,
+        'data_sharing_pct': data_sharing_pct,
+    })
 
     # Filter to funders with >= min_data_sharing
-    df_filtered = df[df['data_sharing_pubs'] >= args.min_data_sharing].copy()
+    df_filtered = df[df['data_sharing_pubs'] >= args.min_data_sharing]
     df_filtered = df_filtered.sort_values('data_sharing_pubs', ascending=False)
 
     # Save output
@@ -385,8 +528,8 @@ def main():
     print("=" * 70)
     print(f"{'Funder':<50} {'Total':>10} {'DataShare':>10} {'%':>8}")
     print("-" * 78)
-    for _, row in df_filtered.head(20).iterrows():
-        print(f"{row['funder']:<50} {row['total_pubs']:>10,} {row['data_sharing_pubs']:>10,} {row['data_sharing_pct']:>7.1f}%")
+    for row in df_filtered.head(20).itertuples(index=False):
+        print(f"{row.funder:<50} {row.total_pubs:>10,} {row.data_sharing_pubs:>10,} {row.data_sharing_pct:>7.1f}%")
 
     if len(df_filtered) > 20:
         print(f"... and {len(df_filtered) - 20} more funders")
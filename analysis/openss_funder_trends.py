@@ -40,20 +40,25 @@ Updated: 2025-12-07 - Added v3 parent-child aggregation support
 """
 
 import argparse
-import gc
 import glob
 import logging
 import sys
 import warnings
-from collections import defaultdict
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+from multiprocessing import cpu_count
 from pathlib import Path
 
 import duckdb
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 
 # Suppress pandas FutureWarnings about deprecated concat/combine behavior
 warnings.filterwarnings('ignore', category=FutureWarning, module='pandas')
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pandas as pd
 
 # Add parent directory to path for imports
@@ -75,6 +80,16 @@ ALLOWED_ARTICLE_TYPES = (
     'systematic-review',
     'other',
 )
+ALLOWED_ARTICLE_TYPES_LOWER = frozenset(t.lower() for t in ALLOWED_ARTICLE_TYPES)
+
+FUNDING_COLS = ['fund_text', 'fund_pmc_institute', 'fund_pmc_source', 'fund_pmc_anysource']
+YEAR_COLS = ['year_epub', 'year_ppub']
+
+# Rows per record batch when streaming rtrans parquet files. Kept equal to
+# funder_data_sharing_summary.py's BATCH_SIZE: this scanner's peak memory
+# barely moves with it (about 500 MB from 32k to 256k rows), and there 64k
+# keeps memory down without slowing the scan
+BATCH_SIZE = 64_000
 
 # Top 10 funders for graph display (selected dynamically based on data)
 # These are for fallback display names and colors
@@ -111,22 +126,21 @@ FUNDER_COLORS = [
 ]
 
 
-def normalize_pmcid(pmcid: str) -> str:
-    """Normalize PMCID to PMC######### format."""
-    if pd.isna(pmcid):
-        return None
-    pmcid = str(pmcid).strip().upper()
-    if pmcid.startswith('PMCPMC'):
-        pmcid = pmcid[3:]
-    if pmcid.endswith('.TXT'):
-        pmcid = pmcid[:-4]
-    if not pmcid.startswith('PMC'):
-        pmcid = 'PMC' + pmcid
-    return pmcid
+def normalize_pmcid_array(pmcids) -> pa.ChunkedArray:
+    """
+    Normalize an Arrow array of PMCIDs to PMC######### format (nulls stay null).
 
+    Also accepts a dataset field expression, returning the equivalent
+    expression for use in dataset projections and filters.
+    """
+    ids = pc.utf8_upper(pc.utf8_trim_whitespace(pmcids.cast(pa.string())))
+    ids = pc.if_else(pc.starts_with(ids, 'PMCPMC'), pc.utf8_slice_codeunits(ids, 3), ids)
+    ids = pc.if_else(pc.ends_with(ids, '.TXT'), pc.utf8_slice_codeunits(ids, 0, -4), ids)
+    return pc.if_else(pc.starts_with(ids, 'PMC'), ids, pc.utf8_replace_slice(ids, 0, 0, 'PMC'))
 
-def load_article_types(registry_path: Path) -> dict:
-    """Load article types from pmcid_registry.duckdb."""
+
+def load_article_types(registry_path: Path) -> pa.Table:
+    """Load article types from pmcid_registry.duckdb as an Arrow table (pmcid, article_type)."""
     logger.info(f"Loading article types from {registry_path}")
     con = duckdb.connect(str(registry_path), read_only=True)
 
@@ -143,63 +157,233 @@ def load_article_types(registry_path: Path) -> dict:
 
     logger.info(f"Using table: {table_name}")
 
-    result = con.execute(f"""
+    article_types = con.execute(f"""
         SELECT pmcid, article_type
         FROM {table_name}
         WHERE article_type IS NOT NULL
-    """).fetchall()
-
-    article_types = {row[0]: row[1] for row in result}
+    """).to_arrow_table()
     con.close()
 
-    logger.info(f"Loaded {len(article_types):,} article types")
+    logger.info(f"Loaded {article_types.num_rows:,} article types")
     return article_types
 
 
-def is_allowed_article_type(article_type: str) -> bool:
-    """Check if article type is allowed for research analysis."""
-    if pd.isna(article_type) or article_type == '':
-        return True  # Blank is allowed
-    return article_type.lower() in [t.lower() for t in ALLOWED_ARTICLE_TYPES]
+def extract_year(df: pd.DataFrame) -> pd.Series:
+    """Publication year per row, preferring year_epub over year_ppub (NaN if neither)."""
+    year = pd.Series(np.nan, index=df.index)
+    for yc in YEAR_COLS:
+        if yc in df.columns:
+            year = year.combine_first(pd.to_numeric(df[yc], errors='coerce'))
+    return year
+
+
+def combine_funding_text(df: pd.DataFrame, funding_cols: list) -> pa.Array:
+    """Join funding columns into one Arrow string array (nulls become empty strings)."""
+    return pc.binary_join_element_wise(
+        *[pa.array(df[col], from_pandas=True).cast(pa.string()) for col in funding_cols], ' ',
+        null_handling='replace', null_replacement=''
+    )
+
+
+def match_funder_pattern(combined_fund: pa.Array, pattern: str) -> np.ndarray:
+    """
+    Case-insensitive regex match of a funder pattern against combined funding text.
+
+    Runs Arrow's RE2 kernel on the string buffer, so pattern must be in RE2
+    syntax (FunderNormalizer.re2_patterns, which match the same texts as the
+    re patterns).
+    """
+    matches = pc.match_substring_regex(combined_fund, pattern, ignore_case=True)
+    return matches.to_numpy(zero_copy_only=False)
+
+
+def any_funder_pattern(patterns: dict) -> str:
+    """Single alternation matching text that mentions any of the funder patterns."""
+    return '|'.join(f'(?:{pattern})' for pattern in patterns.values())
+
+
+def count_funder_matches_by_year(combined_fund: pa.Array, years: np.ndarray, counts: dict) -> None:
+    """
+    Add per-funder year counts for rows whose funding text matches each pattern.
+
+    One pass of the any-funder alternation first drops rows mentioning no
+    funder, so the per-funder patterns only scan candidate rows.
+    """
+    candidates = match_funder_pattern(combined_fund, _worker_any_pattern)
+    if not candidates.any():
+        return
+    combined_fund = combined_fund.filter(candidates)
+    years = years[candidates]
+
+    for funder, pattern in _worker_patterns.items():
+        matches = match_funder_pattern(combined_fund, pattern)
+        matched_years, year_counts = np.unique(years[matches], return_counts=True)
+        counts[funder].update(dict(zip(matched_years.tolist(), year_counts.tolist())))
+
+
+def excluded_article_pmcids(article_types: pa.Table) -> pa.Array:
+    """
+    PMCIDs whose article type is not allowed for research analysis.
+
+    Returned as an Arrow string array, the value set used by every is_in
+    filter (and shipped to workers as flat buffers rather than a pickled set).
+    """
+    # Article types have few distinct values: check each distinct type once,
+    # then select rows by dictionary index
+    encoded = pc.dictionary_encode(article_types.column('article_type')).combine_chunks()
+    type_names = encoded.dictionary.cast(pa.string())
+    lowered = pc.utf8_lower(type_names)
+    allowed_types = pc.or_(
+        pc.equal(lowered, ''),
+        pc.is_in(lowered, value_set=pa.array(sorted(ALLOWED_ARTICLE_TYPES_LOWER), type=pa.string())),
+    )
+    allowed = pc.take(allowed_types, encoded.indices)
+    pmcids = article_types.column('pmcid').cast(pa.string())
+    return pmcids.filter(pc.invert(allowed)).combine_chunks()
 
 
-def load_open_data_pmcids(oddpub_file: Path, article_types: dict) -> set:
-    """Load PMCIDs of research articles with open data detected by oddpub."""
+def load_open_data_pmcids(oddpub_file: Path, excluded_pmcids: pa.Array) -> pa.Array:
+    """
+    Load PMCIDs of research articles with open data detected by oddpub.
+
+    Args:
+        oddpub_file: Merged oddpub parquet file
+        excluded_pmcids: PMCIDs with a non-research article type
+                         (from excluded_article_pmcids)
+
+    Returns:
+        Arrow string array of unique PMCIDs
+    """
     logger.info(f"Loading open data PMCIDs from {oddpub_file}")
-    df = pd.read_parquet(oddpub_file)
-    logger.info(f"Loaded {len(df):,} records")
+    dataset = ds.dataset(oddpub_file, format='parquet')
+    total_records = dataset.count_rows()
+    logger.info(f"Loaded {total_records:,} records")
 
-    open_data_df = df[df['is_open_data'] == True]
-    logger.info(f"Found {len(open_data_df):,} with is_open_data=true ({100*len(open_data_df)/len(df):.2f}%)")
+    # Only the identifier columns are needed; filter on is_open_data in the scan
+    id_cols = [c for c in ['article', 'pmcid', 'filename'] if c in dataset.schema.names]
+    table = dataset.to_table(columns=id_cols, filter=ds.field('is_open_data') == True)
+    logger.info(f"Found {table.num_rows:,} with is_open_data=true ({100*table.num_rows/total_records:.2f}%)")
 
-    pmcids = set()
+    kept_ids = []
     filtered_out = 0
 
-    for col in ['article', 'pmcid', 'filename']:
-        if col in open_data_df.columns:
-            for val in open_data_df[col].dropna().unique():
-                pmcid = normalize_pmcid(val)
-                if pmcid:
-                    # Filter by article type
-                    art_type = article_types.get(pmcid)
-                    if is_allowed_article_type(art_type):
-                        pmcids.add(pmcid)
-                    else:
-                        filtered_out += 1
+    for col in id_cols:
+        # Normalize each distinct identifier once, then filter by article type
+        unique_ids = pc.unique(table.column(col)).drop_null()
+        normalized = normalize_pmcid_array(unique_ids)
+        allowed = pc.invert(pc.is_in(normalized, value_set=excluded_pmcids))
+        kept = normalized.filter(allowed)
+        kept_ids.append(kept)
+        filtered_out += len(normalized) - len(kept)
+
+    pmcids = pc.unique(pa.chunked_array(kept_ids, type=pa.string())) if kept_ids else pa.array([], type=pa.string())
 
     logger.info(f"Extracted {len(pmcids):,} unique research article PMCIDs with open data")
     logger.info(f"Filtered out {filtered_out:,} non-research articles (review, editorial, letter, etc.)")
     return pmcids
 
 
+# Per-process state for worker processes (set once by the _init_*_worker functions)
+_worker_patterns = None
+_worker_any_pattern = None
+_worker_open_data = None
+_worker_excluded = None
+
+
+def _worker_pool_kwargs(initializer, initargs: tuple) -> dict:
+    """
+    ProcessPoolExecutor arguments that set up worker state via initializer.
+
+    Where fork is available the initializer runs once in the parent and the
+    workers inherit its globals copy-on-write, so the PMCID arrays are not
+    pickled to every worker.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        initializer(*initargs)
+        return {'mp_context': multiprocessing.get_context('fork')}
+    return {'initializer': initializer, 'initargs': initargs}
+
+
+def _init_counts_worker(patterns: dict, open_data_pmcids: pa.Array):
+    """Initialize worker process with funder patterns and open data PMCIDs."""
+    global _worker_patterns, _worker_any_pattern, _worker_open_data
+    _worker_patterns = patterns
+    _worker_any_pattern = any_funder_pattern(patterns)
+    # Arrow array for the in-scan row filter
+    _worker_open_data = open_data_pmcids
+
+
+def _count_open_data_funders_in_file(pf: str) -> tuple:
+    """
+    Count funders by year among open data articles in one rtrans file (runs in worker process).
+
+    Returns tuple of (matched, counts) where counts maps funder -> Counter
+    of year -> count
+    """
+    counts = {funder: Counter() for funder in _worker_patterns}
+
+    dataset = ds.dataset(pf, format='parquet')
+    schema_cols = set(dataset.schema.names)
+    if 'pmcid_pmc' in schema_cols:
+        id_col = 'pmcid_pmc'
+    elif 'pmcid' in schema_cols:
+        id_col = 'pmcid'
+    else:
+        return 0, counts
+
+    # Files without funding text cannot contribute any funder counts
+    available_cols = [c for c in FUNDING_COLS if c in schema_cols]
+    if not available_cols:
+        return 0, counts
+
+    # Normalize PMCID inside the scan and keep only open data research
+    # articles, so non-matching rows are never converted to pandas
+    pmcid_norm = normalize_pmcid_array(ds.field(id_col))
+    columns = {'pmcid_norm': pmcid_norm}
+    columns.update({c: ds.field(c) for c in YEAR_COLS + available_cols if c in schema_cols})
+
+    # Stream the matching rows one record batch at a time
+    matched = 0
+    for batch in dataset.to_batches(columns=columns, filter=pmcid_norm.isin(_worker_open_data),
+                                    batch_size=BATCH_SIZE):
+        df = batch.to_pandas()
+        matched += len(df)
+        if len(df) == 0:
+            continue
+
+        # Get year - prefer epub, fallback to ppub
+        df['year'] = extract_year(df)
+
+        # Skip records without year
+        df = df[df['year'].notna()]
+        df['year'] = df['year'].astype(int)
+
+        # Filter to reasonable year range (2000-2025)
+        df = df[(df['year'] >= 2000) & (df['year'] <= 2025)]
+
+        if len(df) == 0:
+            continue
+
+        # Combine all funding text
+        combined_fund = combine_funding_text(df, available_cols)
+
+        # For each canonical funder, count matches by year
+        count_funder_matches_by_year(combined_fund, df['year'].to_numpy(), counts)
+
+    return matched, counts
+
+
 def count_funders_by_year(rtrans_dir: Path,
                           normalizer: FunderNormalizer,
-                          open_data_pmcids: set,
-                          article_types: dict,
-                          limit: int = None) -> dict:
+                          open_data_pmcids: pa.Array,
+                          limit: int = None,
+                          workers: int = None) -> dict:
     """
     Count all canonical funders in open data research articles by year.
 
+    Files are counted in parallel worker processes and the per-file
+    counts summed.
+
     Returns dict with counts[funder][year] = count
     """
     parquet_files = sorted(glob.glob(f'{rtrans_dir}/*.parquet'))
@@ -209,101 +393,129 @@ def count_funders_by_year(rtrans_dir: Path,
         logger.info(f"Limited to first {limit} files for testing")
 
     all_funders = normalizer.get_all_canonical_names()
-    logger.info(f"Processing {len(parquet_files)} rtrans parquet files")
+    num_workers = workers or cpu_count()
+    logger.info(f"Processing {len(parquet_files)} rtrans parquet files with {num_workers} workers")
     logger.info(f"Searching for {len(all_funders)} canonical funders in {len(open_data_pmcids):,} open data research articles")
 
     # Initialize counts: funder -> year -> count
-    counts = {funder: defaultdict(int) for funder in all_funders}
+    counts = {funder: Counter() for funder in all_funders}
     total_matched = 0
 
-    funding_cols = ['fund_text', 'fund_pmc_institute', 'fund_pmc_source', 'fund_pmc_anysource']
-    year_cols = ['year_epub', 'year_ppub']
+    # RE2 pattern strings for Arrow's regex kernel, shipped to workers
+    patterns = {
+        funder: normalizer.re2_patterns[funder]
+        for funder in all_funders
+        if funder in normalizer.re2_patterns
+    }
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        **_worker_pool_kwargs(_init_counts_worker, (patterns, open_data_pmcids))
+    ) as executor:
+        future_to_file = {
+            executor.submit(_count_open_data_funders_in_file, pf): pf
+            for pf in parquet_files
+        }
+
+        for i, future in enumerate(as_completed(future_to_file)):
+            pf = future_to_file[future]
+            try:
+                file_matched, file_counts = future.result()
+            except Exception as e:
+                logger.warning(f"Error processing {Path(pf).name}: {e}")
+                continue
 
-    for i, pf in enumerate(parquet_files):
-        try:
-            df = pd.read_parquet(pf)
+            total_matched += file_matched
+            for funder, year_counts in file_counts.items():
+                counts[funder].update(year_counts)
 
-            # Normalize PMCID for matching
-            if 'pmcid_pmc' in df.columns:
-                df['pmcid_norm'] = df['pmcid_pmc'].apply(normalize_pmcid)
-            elif 'pmcid' in df.columns:
-                df['pmcid_norm'] = df['pmcid'].apply(normalize_pmcid)
-            else:
-                continue
+            if (i + 1) == 1:
+                logger.info(f"  First file processed - script running normally...")
+            if (i + 1) % 50 == 0 or (i + 1) == len(parquet_files):
+                pct = (i + 1) / len(parquet_files) * 100
+                logger.info(f"  Processed {i+1}/{len(parquet_files)} files ({pct:.1f}%), {total_matched:,} open data articles matched")
 
-            # Filter to open data research articles only
-            df = df[df['pmcid_norm'].isin(open_data_pmcids)]
+    logger.info(f"Finished processing {len(parquet_files)} files")
+    logger.info(f"Total open data research articles matched: {total_matched:,}")
 
-            if len(df) == 0:
-                continue
+    return counts
 
-            total_matched += len(df)
 
-            # Get year - prefer epub, fallback to ppub (using numpy for clean handling)
-            year_arr = np.full(len(df), np.nan)
-            for yc in year_cols:
-                if yc in df.columns:
-                    year_vals = pd.to_numeric(df[yc], errors='coerce').values
-                    year_arr = np.where(np.isnan(year_arr), year_vals, year_arr)
-            df['year'] = year_arr
+def _init_totals_worker(patterns: dict, excluded_pmcids: pa.Array):
+    """Initialize worker process with funder patterns and excluded PMCIDs."""
+    global _worker_patterns, _worker_any_pattern, _worker_excluded
+    _worker_patterns = patterns
+    _worker_any_pattern = any_funder_pattern(patterns)
+    _worker_excluded = excluded_pmcids
 
-            # Skip records without year
-            df = df[df['year'].notna()]
-            df['year'] = df['year'].astype(int)
 
-            # Filter to reasonable year range (2000-2025)
-            df = df[(df['year'] >= 2000) & (df['year'] <= 2025)]
+def _count_corpus_totals_in_file(pf: str) -> tuple:
+    """
+    Count research articles per funder and year in one rtrans file (runs in worker process).
 
-            if len(df) == 0:
-                continue
+    Returns tuple of (total_research, total_filtered, totals) where totals
+    maps funder -> Counter of year -> count
+    """
+    totals = {funder: Counter() for funder in _worker_patterns}
+    total_research = 0
+    total_filtered = 0
 
-            # Get available funding columns
-            available_cols = [c for c in funding_cols if c in df.columns]
-            if not available_cols:
-                continue
+    dataset = ds.dataset(pf, format='parquet')
+    schema_cols = set(dataset.schema.names)
+    if 'pmcid_pmc' in schema_cols:
+        id_col = 'pmcid_pmc'
+    elif 'pmcid' in schema_cols:
+        id_col = 'pmcid'
+    else:
+        return total_research, total_filtered, totals
 
-            # Combine all funding text
-            df['combined_fund'] = ''
-            for col in available_cols:
-                df['combined_fund'] = df['combined_fund'] + ' ' + df[col].fillna('').astype(str)
-
-            # For each canonical funder, count matches by year
-            for funder in all_funders:
-                pattern = normalizer.search_patterns.get(funder)
-                if pattern:
-                    matches = df['combined_fund'].str.contains(
-                        pattern.pattern, case=False, na=False, regex=True
-                    )
-                    # Group by year and count
-                    matched_df = df[matches]
-                    for year, count in matched_df.groupby('year').size().items():
-                        counts[funder][year] += count
-
-            del df
-            gc.collect()
+    # Project only the columns used below and drop non-research articles
+    # inside the scan, streaming one record batch at a time; the PMCID is
+    # only needed by the filter
+    pmcid_norm = normalize_pmcid_array(ds.field(id_col))
+    columns = {c: ds.field(c) for c in YEAR_COLS + FUNDING_COLS if c in schema_cols}
+    research = ~pmcid_norm.isin(_worker_excluded)
 
-            if (i + 1) == 1:
-                logger.info(f"  First file processed - script running normally...")
-            if (i + 1) % 50 == 0 or (i + 1) == len(parquet_files):
-                pct = (i + 1) / len(parquet_files) * 100
-                logger.info(f"  Processed {i+1}/{len(parquet_files)} files ({pct:.1f}%), {total_matched:,} open data articles matched")
+    for batch in dataset.to_batches(columns=columns, filter=research, batch_size=BATCH_SIZE):
+        df = batch.to_pandas()
+        total_research += len(df)
 
-        except Exception as e:
-            logger.warning(f"Error processing {Path(pf).name}: {e}")
+        if len(df) == 0:
+            continue
 
-    logger.info(f"Finished processing {len(parquet_files)} files")
-    logger.info(f"Total open data research articles matched: {total_matched:,}")
+        # Get year - prefer epub, fallback to ppub
+        df['year'] = extract_year(df)
 
-    return counts
+        df = df[df['year'].notna()]
+        df['year'] = df['year'].astype(int)
+        df = df[(df['year'] >= 2000) & (df['year'] <= 2025)]
+
+        if len(df) == 0:
+            continue
+
+        available_cols = [c for c in FUNDING_COLS if c in df.columns]
+        if not available_cols:
+            continue
+
+        combined_fund = combine_funding_text(df, available_cols)
+
+        count_funder_matches_by_year(combined_fund, df['year'].to_numpy(), totals)
+
+    total_filtered = dataset.count_rows() - total_research
+    return total_research, total_filtered, totals
 
 
 def load_corpus_totals_by_year(rtrans_dir: Path,
                                 normalizer: FunderNormalizer,
-                                article_types: dict,
-                                limit: int = None) -> dict:
+                                excluded_pmcids: pa.Array,
+                                limit: int = None,
+                                workers: int = None) -> dict:
     """
     Compute corpus totals by year for each funder (research articles only).
 
+    Files are counted in parallel worker processes and the per-file
+    counts summed.
+
     Returns dict with totals[funder][year] = count
     """
     parquet_files = sorted(glob.glob(f'{rtrans_dir}/*.parquet'))
@@ -312,70 +524,40 @@ def load_corpus_totals_by_year(rtrans_dir: Path,
         parquet_files = parquet_files[:limit]
 
     all_funders = normalizer.get_all_canonical_names()
-    logger.info(f"Computing corpus totals by year from {len(parquet_files)} files (research articles only)")
+    num_workers = workers or cpu_count()
+    logger.info(f"Computing corpus totals by year from {len(parquet_files)} files with {num_workers} workers (research articles only)")
 
-    totals = {funder: defaultdict(int) for funder in all_funders}
-    funding_cols = ['fund_text', 'fund_pmc_institute', 'fund_pmc_source', 'fund_pmc_anysource']
-    year_cols = ['year_epub', 'year_ppub']
+    totals = {funder: Counter() for funder in all_funders}
     total_research = 0
     total_filtered = 0
 
-    for i, pf in enumerate(parquet_files):
-        try:
-            df = pd.read_parquet(pf)
-
-            # Normalize PMCID
-            if 'pmcid_pmc' in df.columns:
-                df['pmcid_norm'] = df['pmcid_pmc'].apply(normalize_pmcid)
-            elif 'pmcid' in df.columns:
-                df['pmcid_norm'] = df['pmcid'].apply(normalize_pmcid)
-            else:
+    # RE2 pattern strings for Arrow's regex kernel, shipped to workers
+    patterns = {
+        funder: normalizer.re2_patterns[funder]
+        for funder in all_funders
+        if funder in normalizer.re2_patterns
+    }
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        **_worker_pool_kwargs(_init_totals_worker, (patterns, excluded_pmcids))
+    ) as executor:
+        future_to_file = {
+            executor.submit(_count_corpus_totals_in_file, pf): pf
+            for pf in parquet_files
+        }
+
+        for i, future in enumerate(as_completed(future_to_file)):
+            pf = future_to_file[future]
+            try:
+                file_research, file_filtered, file_totals = future.result()
+            except Exception as e:
+                logger.warning(f"Error processing {Path(pf).name}: {e}")
                 continue
 
-            # Filter to research articles only
-            original_len = len(df)
-            df = df[df['pmcid_norm'].apply(lambda x: is_allowed_article_type(article_types.get(x)))]
-            total_filtered += original_len - len(df)
-            total_research += len(df)
-
-            if len(df) == 0:
-                continue
-
-            # Get year - prefer epub, fallback to ppub (using numpy for clean handling)
-            year_arr = np.full(len(df), np.nan)
-            for yc in year_cols:
-                if yc in df.columns:
-                    year_vals = pd.to_numeric(df[yc], errors='coerce').values
-                    year_arr = np.where(np.isnan(year_arr), year_vals, year_arr)
-            df['year'] = year_arr
-
-            df = df[df['year'].notna()]
-            df['year'] = df['year'].astype(int)
-            df = df[(df['year'] >= 2000) & (df['year'] <= 2025)]
-
-            if len(df) == 0:
-                continue
-
-            available_cols = [c for c in funding_cols if c in df.columns]
-            if not available_cols:
-                continue
-
-            df['combined_fund'] = ''
-            for col in available_cols:
-                df['combined_fund'] = df['combined_fund'] + ' ' + df[col].fillna('').astype(str)
-
-            for funder in all_funders:
-                pattern = normalizer.search_patterns.get(funder)
-                if pattern:
-                    matches = df['combined_fund'].str.contains(
-                        pattern.pattern, case=False, na=False, regex=True
-                    )
-                    matched_df = df[matches]
-                    for year, count in matched_df.groupby('year').size().items():
-                        totals[funder][year] += count
-
-            del df
-            gc.collect()
+            total_research += file_research
+            total_filtered += file_filtered
+            for funder, year_counts in file_totals.items():
+                totals[funder].update(year_counts)
 
             if (i + 1) == 1:
                 logger.info(f"  First file processed - corpus totals running normally...")
@@ -383,9 +565,6 @@ def load_corpus_totals_by_year(rtrans_dir: Path,
                 pct = (i + 1) / len(parquet_files) * 100
                 logger.info(f"  Processed {i+1}/{len(parquet_files)} files ({pct:.1f}%) for corpus totals ({total_research:,} research articles)")
 
-        except Exception as e:
-            logger.warning(f"Error processing {Path(pf).name}: {e}")
-
     logger.info(f"Total research articles: {total_research:,} (filtered out {total_filtered:,} non-research)")
     return totals
 
@@ -453,7 +632,8 @@ def aggregate_children_to_parents(counts: dict, normalizer: FunderNormalizer) ->
     return aggregated
 
 
-def create_counts_plot(counts: dict, output_dir: Path, year_range: tuple, normalizer: FunderNormalizer):
+def create_counts_plot(counts: dict, output_dir: Path, year_range: tuple, normalizer: FunderNormalizer,
+                       dpi: int = 300):
     """Create line graph of absolute counts by year (top 10 in graph, all in CSV)."""
     # Convert to DataFrame with all funders
     data = {}
@@ -486,7 +666,9 @@ def create_counts_plot(counts: dict, output_dir: Path, year_range: tuple, normal
     df = df.drop('total', axis=1)
 
     # Create plot
-    fig, ax = plt.subplots(figsize=(12, 8))
+    # Figure API (no pyplot state or GUI backend needed to render files)
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
 
     for i, funder in enumerate(df.index):
         years = list(df.columns)
@@ -506,14 +688,14 @@ def create_counts_plot(counts: dict, output_dir: Path, year_range: tuple, normal
     ax.set_xticks(years)
     ax.set_xticklabels(years, rotation=45, ha='right')
 
-    plt.tight_layout()
+    fig.tight_layout()
     png_path = output_dir / 'openss_funder_counts_by_year.png'
-    plt.savefig(png_path, dpi=300, bbox_inches='tight')
+    fig.savefig(png_path, dpi=dpi, bbox_inches='tight')
     logger.info(f"Saved counts plot to {png_path}")
-    plt.close()
 
 
-def create_percentages_plot(counts: dict, totals: dict, output_dir: Path, year_range: tuple, normalizer: FunderNormalizer):
+def create_percentages_plot(counts: dict, totals: dict, output_dir: Path, year_range: tuple, normalizer: FunderNormalizer,
+                            dpi: int = 300):
     """Create line graph of percentages by year (top 10 in graph, all in CSV)."""
     # Calculate percentages for all funders
     percentages = {}
@@ -551,7 +733,9 @@ def create_percentages_plot(counts: dict, totals: dict, output_dir: Path, year_r
     df = df.head(10)
 
     # Create plot
-    fig, ax = plt.subplots(figsize=(12, 8))
+    # Figure API (no pyplot state or GUI backend needed to render files)
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
 
     for i, funder in enumerate(df.index):
         years = list(df.columns)
@@ -571,11 +755,10 @@ def create_percentages_plot(counts: dict, totals: dict, output_dir: Path, year_r
     ax.set_xticks(years)
     ax.set_xticklabels(years, rotation=45, ha='right')
 
-    plt.tight_layout()
+    fig.tight_layout()
     png_path = output_dir / 'openss_funder_percentages_by_year.png'
-    plt.savefig(png_path, dpi=300, bbox_inches='tight')
+    fig.savefig(png_path, dpi=dpi, bbox_inches='tight')
     logger.info(f"Saved percentages plot to {png_path}")
-    plt.close()
 
 
 def main():
@@ -598,10 +781,14 @@ def main():
     parser.add_argument('--year-range', type=int, nargs=2, metavar=('MIN', 'MAX'),
                         default=[2010, 2024],
                         help='Year range for plots (default: 2010 2024)')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='Resolution of PNG graphs (default: 300)')
     parser.add_argument('--limit', type=int, default=None,
                         help='Limit number of rtrans files (for testing)')
     parser.add_argument('--aggregate-children', action='store_true',
                         help='Aggregate child funder counts into parent totals (e.g., NIH institutes -> NIH)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f'Number of parallel workers for rtrans files (default: CPU count = {cpu_count()})')
 
     args = parser.parse_args()
 
@@ -621,8 +808,11 @@ def main():
     # Load article types from registry
     article_types = load_article_types(args.registry)
 
+    # Only the (much smaller) set of non-research PMCIDs is needed for filtering
+    excluded_pmcids = excluded_article_pmcids(article_types)
+
     # Load open data PMCIDs (filtered to research articles)
-    open_data_pmcids = load_open_data_pmcids(args.oddpub_file, article_types)
+    open_data_pmcids = load_open_data_pmcids(args.oddpub_file, excluded_pmcids)
 
     # Initialize normalizer with specified aliases file
     normalizer = FunderNormalizer(args.funder_aliases)
@@ -631,7 +821,7 @@ def main():
 
     # Count all funders by year in open data research articles
     counts = count_funders_by_year(
-        args.rtrans_dir, normalizer, open_data_pmcids, article_types, args.limit
+        args.rtrans_dir, normalizer, open_data_pmcids, args.limit, args.workers
     )
 
     # Aggregate children to parents if requested
@@ -642,19 +832,19 @@ def main():
     # Generate counts graph
     if args.graph in ['counts', 'both']:
         logger.info("Generating counts graph...")
-        create_counts_plot(counts, args.output_dir, tuple(args.year_range), normalizer)
+        create_counts_plot(counts, args.output_dir, tuple(args.year_range), normalizer, args.dpi)
 
     # Generate percentages graph
     if args.graph in ['percentages', 'both']:
         logger.info("Computing corpus totals for percentages (research articles only)...")
         totals = load_corpus_totals_by_year(
-            args.rtrans_dir, normalizer, article_types, args.limit
+            args.rtrans_dir, normalizer, excluded_pmcids, args.limit, args.workers
         )
         # Aggregate totals too if aggregating children
         if args.aggregate_children:
             logger.info("Aggregating corpus totals to parent funders...")
             totals = aggregate_children_to_parents(totals, normalizer)
-        create_percentages_plot(counts, totals, args.output_dir, tuple(args.year_range), normalizer)
+        create_percentages_plot(counts, totals, args.output_dir, tuple(args.year_range), normalizer, args.dpi)
 
     # Print summary
     print("\n" + "=" * 70)
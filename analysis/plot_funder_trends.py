@@ -38,8 +38,10 @@ import argparse
 import logging
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.ticker import FuncFormatter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -141,13 +143,14 @@ def create_color_map(funders: list) -> dict:
 
 
 def plot_counts_graph(df: pd.DataFrame, top_funders: list, color_map: dict,
-                      output_path: Path, separate_legend: bool = False):
+                      output_path: Path, separate_legend: bool = False, dpi: int = 300):
     """Create the counts line graph."""
     # Get year columns (exclude 'total')
     year_cols = [c for c in df.columns if c.isdigit() or (isinstance(c, int))]
     years = [int(c) for c in year_cols]
 
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
 
     lines = []
     labels = []
@@ -173,27 +176,27 @@ def plot_counts_graph(df: pd.DataFrame, top_funders: list, color_map: dict,
     ax.set_ylim(bottom=0)
 
     # Format y-axis with comma separators
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format(int(x), ',')))
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: format(int(x), ',')))
 
     if not separate_legend:
         ax.legend(loc='upper left', fontsize=9)
 
-    plt.tight_layout()
-    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
     logger.info(f"Saved counts graph: {output_path}")
-    plt.close(fig)
 
     return lines, labels
 
 
 def plot_percentages_graph(df: pd.DataFrame, top_funders: list, color_map: dict,
-                           output_path: Path, separate_legend: bool = False):
+                           output_path: Path, separate_legend: bool = False, dpi: int = 300):
     """Create the percentages line graph."""
     # Get year columns
     year_cols = [c for c in df.columns if c.isdigit() or (isinstance(c, int))]
     years = [int(c) for c in year_cols]
 
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig = Figure(figsize=(12, 8))
+    ax = fig.subplots()
 
     lines = []
     labels = []
@@ -219,26 +222,25 @@ def plot_percentages_graph(df: pd.DataFrame, top_funders: list, color_map: dict,
     ax.set_ylim(bottom=0)
 
     # Format y-axis as percentage
-    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x:.0f}%'))
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x:.0f}%'))
 
     if not separate_legend:
         ax.legend(loc='upper left', fontsize=9)
 
-    plt.tight_layout()
-    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=dpi, bbox_inches='tight')
     logger.info(f"Saved percentages graph: {output_path}")
-    plt.close(fig)
 
     return lines, labels
 
 
-def save_legend(lines, labels, output_path: Path, orientation: str = 'vertical'):
+def save_legend(lines, labels, output_path: Path, orientation: str = 'vertical', dpi: int = 300):
     """Save legend as a separate file."""
     # Create a figure just for the legend
     if orientation == 'vertical':
-        fig_legend = plt.figure(figsize=(3, 4))
+        fig_legend = Figure(figsize=(3, 4))
     else:
-        fig_legend = plt.figure(figsize=(10, 1.5))
+        fig_legend = Figure(figsize=(10, 1.5))
 
     ncol = 1 if orientation == 'vertical' else 5
 
@@ -250,10 +252,9 @@ def save_legend(lines, labels, output_path: Path, orientation: str = 'vertical')
                                fancybox=True,
                                shadow=False)
 
-    fig_legend.savefig(output_path, dpi=300, bbox_inches='tight',
+    fig_legend.savefig(output_path, dpi=dpi, bbox_inches='tight',
                        transparent=True)
     logger.info(f"Saved separate legend: {output_path}")
-    plt.close(fig_legend)
 
 
 def main():
@@ -268,6 +269,8 @@ def main():
     parser.add_argument('--format', type=str, nargs='+', default=['png'],
                         choices=['png', 'svg', 'pdf'],
                         help='Output format(s) (default: png)')
+    parser.add_argument('--dpi', type=int, default=300,
+                        help='Resolution of raster (PNG) output (default: 300)')
     parser.add_argument('--separate-legends', action='store_true',
                         help='Save legends as separate files')
     parser.add_argument('--legend-orientation', type=str, default='vertical',
@@ -306,36 +309,34 @@ def main():
         counts_path = output_dir / f'openss_funder_counts_by_year_v2.{fmt}'
         lines, labels = plot_counts_graph(
             counts_df, top_funders, color_map, counts_path,
-            separate_legend=args.separate_legends
+            separate_legend=args.separate_legends, dpi=args.dpi
         )
 
         # Percentages graph
         pct_path = output_dir / f'openss_funder_percentages_by_year_v2.{fmt}'
         plot_percentages_graph(
             pct_df, top_funders, color_map, pct_path,
-            separate_legend=args.separate_legends
+            separate_legend=args.separate_legends, dpi=args.dpi
         )
 
         # Save separate legends if requested
         if args.separate_legends:
             # Need to recreate lines for legend export
-            fig_temp, ax_temp = plt.subplots()
             legend_lines = []
             legend_labels = []
             for i, funder in enumerate(top_funders):
-                line, = ax_temp.plot([], [],
-                                    color=color_map[funder],
-                                    linestyle=LINE_STYLES[i % len(LINE_STYLES)],
-                                    marker=MARKERS[i % len(MARKERS)],
-                                    markersize=6,
-                                    linewidth=2,
-                                    label=funder)
+                line = Line2D([], [],
+                              color=color_map[funder],
+                              linestyle=LINE_STYLES[i % len(LINE_STYLES)],
+                              marker=MARKERS[i % len(MARKERS)],
+                              markersize=6,
+                              linewidth=2,
+                              label=funder)
                 legend_lines.append(line)
                 legend_labels.append(funder)
-            plt.close(fig_temp)
 
             legend_path = output_dir / f'openss_funder_legend.{fmt}'
-            save_legend(legend_lines, legend_labels, legend_path, args.legend_orientation)
+            save_legend(legend_lines, legend_labels, legend_path, args.legend_orientation, args.dpi)
 
     logger.info("\n" + "=" * 70)
     logger.info("COMPLETE")
@@ -23,12 +23,25 @@ Author: INCF 2025 Poster Analysis
 Date: 2025-12-02
 """
 
+import random
 import re
 from pathlib import Path
 from collections import defaultdict
 
 import pandas as pd
 
+try:
+    import hyperscan
+    HAS_HYPERSCAN = True
+except ImportError:
+    HAS_HYPERSCAN = False
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
 
 class FunderNormalizer:
     """Normalize funder names using alias mapping."""
@@ -48,6 +61,7 @@ class FunderNormalizer:
         self.canonical_to_variants = defaultdict(set)
         self.variant_to_canonical = {}
         self.search_patterns = {}
+        self.re2_patterns = {}  # Same matches as search_patterns, in RE2 syntax
         self.canonical_to_parent = {}  # Maps canonical name to parent funder
         self.canonical_to_country = {}  # Maps canonical name to country
 
@@ -59,27 +73,27 @@ class FunderNormalizer:
         if not self.aliases_csv.exists():
             raise FileNotFoundError(f"Alias file not found: {self.aliases_csv}")
 
-        df = pd.read_csv(self.aliases_csv)
-
-        for _, row in df.iterrows():
-            canonical = row['canonical_name']
-            variant = row['variant']
+        # Only the mapping columns are needed; the count/selection columns are skipped
+        wanted = {'canonical_name', 'variant', 'parent_funder', 'country'}
+        df = pd.read_csv(self.aliases_csv, usecols=lambda col: col in wanted, dtype=str)
 
+        for canonical, variant in zip(df['canonical_name'], df['variant']):
             # Map variant to canonical
             self.variant_to_canonical[variant.lower()] = canonical
             self.variant_to_canonical[canonical.lower()] = canonical
 
             # Map canonical to all variants
-            self.canonical_to_variants[canonical].add(variant)
-            self.canonical_to_variants[canonical].add(canonical)
+            self.canonical_to_variants[canonical].update((variant, canonical))
 
-            # Load parent funder mapping (v3+ schema)
-            if 'parent_funder' in df.columns and pd.notna(row.get('parent_funder')):
-                self.canonical_to_parent[canonical] = row['parent_funder']
+        # Load parent funder mapping (v3+ schema); later rows win, as before
+        if 'parent_funder' in df.columns:
+            with_parent = df[df['parent_funder'].notna()]
+            self.canonical_to_parent.update(zip(with_parent['canonical_name'], with_parent['parent_funder']))
 
-            # Load country mapping (v2+ schema)
-            if 'country' in df.columns and pd.notna(row.get('country')):
-                self.canonical_to_country[canonical] = row['country']
+        # Load country mapping (v2+ schema)
+        if 'country' in df.columns:
+            with_country = df[df['country'].notna()]
+            self.canonical_to_country.update(zip(with_country['canonical_name'], with_country['country']))
 
     def _build_patterns(self):
         """Build regex patterns for each canonical funder."""
@@ -89,17 +103,30 @@ class FunderNormalizer:
 
             # Build pattern with word boundaries for short names
             pattern_parts = []
+            re2_parts = []
             for variant in sorted_variants:
                 escaped = re.escape(variant)
                 # Use word boundaries for acronyms (<=6 chars, all uppercase)
-                if len(variant) <= 6 and variant.isupper():
+                word_boundary = is_acronym(variant)
+                if word_boundary:
                     pattern_parts.append(r'\b' + escaped + r'\b')
                 else:
                     pattern_parts.append(escaped)
+                re2_parts.append(re2_variant_pattern(variant, word_boundary))
 
             # Combine with OR
             pattern = '|'.join(pattern_parts)
             self.search_patterns[canonical] = re.compile(pattern, re.IGNORECASE)
+            self.re2_patterns[canonical] = '|'.join(re2_parts)
+
+        # One-pass prefilter so each text only runs the patterns that can match
+        self.hyperscan_prefilter = None
+        self.literal_prefilter = None
+        variants = {canonical: self.canonical_to_variants[canonical] for canonical in self.search_patterns}
+        if HAS_HYPERSCAN:
+            self.hyperscan_prefilter = build_hyperscan_prefilter(variants)
+        elif HAS_AHOCORASICK:
+            self.literal_prefilter = build_literal_prefilter(variants)
 
     def get_canonical(self, name: str) -> str:
         """
@@ -237,12 +264,8 @@ class FunderNormalizer:
         if pd.isna(text) or not text:
             return []
 
-        found = []
-        for canonical, pattern in self.search_patterns.items():
-            if pattern.search(str(text)):
-                found.append(canonical)
-
-        return found
+        return scan_funders(str(text), self.search_patterns, self.hyperscan_prefilter,
+                            self.literal_prefilter)
 
     def get_all_canonical_names(self) -> list:
         """Get list of all canonical funder names."""
@@ -277,6 +300,267 @@ class FunderNormalizer:
         return result
 
 
+def is_acronym(variant: str) -> bool:
+    """Whether a variant is an acronym (<=6 chars, all uppercase), matched only as a whole word."""
+    return len(variant) <= 6 and variant.isupper()
+
+
+# Groups of lowercase letters that re.IGNORECASE treats as equal although
+# str.lower() keeps them apart (re's extra case equivalences); fold_case maps
+# each group onto its first letter
+_CASE_EQUIVALENTS = (
+    'i\u0131', 's\u017f', '\u00b5\u03bc', '\u03b9\u0345\u1fbe', '\u0390\u1fd3',
+    '\u03b0\u1fe3', '\u03b2\u03d0', '\u03b5\u03f5', '\u03b8\u03d1', '\u03ba\u03f0',
+    '\u03c0\u03d6', '\u03c1\u03f1', '\u03c3\u03c2', '\u03c6\u03d5', '\u0432\u1c80',
+    '\u0434\u1c81', '\u043e\u1c82', '\u0441\u1c83', '\u0442\u1c84\u1c85', '\u044a\u1c86',
+    '\u0463\u1c87', '\ua64b\u1c88', '\u1e61\u1e9b', '\ufb05\ufb06',
+)
+_CASE_FOLD = {ord(c): group[0] for group in _CASE_EQUIVALENTS for c in group[1:]}
+_CASE_FOLD_CHARS = re.compile('[' + ''.join(map(chr, _CASE_FOLD)) + ']')
+
+
+def fold_case(text: str) -> str:
+    """
+    Lowercase text the way re.IGNORECASE compares characters.
+
+    Two strings fold to the same result exactly when each character of one
+    matches the other's under re.IGNORECASE, so a pattern literal can only
+    match where its folded form occurs in the folded text. Beyond
+    str.lower(), this maps U+0130 to 'i' (re's simple lowercase) and the
+    letters of each _CASE_EQUIVALENTS group onto one letter.
+    """
+    if text.isascii():
+        return text.lower()
+    folded = text.replace('\u0130', 'i').lower()
+    if _CASE_FOLD_CHARS.search(folded):
+        folded = folded.translate(_CASE_FOLD)
+    return folded
+
+
+# Letters re.IGNORECASE treats as equal but RE2's case folding keeps apart,
+# keyed by fold_case(letter); re2_variant_pattern spells them out as classes
+_RE2_CASE_CLASSES = {
+    'i': '[i\u0130\u0131]',
+    '\u0390': '[\u0390\u1fd3]',
+    '\u03b0': '[\u03b0\u1fe3]',
+    '\ufb05': '[\ufb05\ufb06]',
+}
+# Python's Unicode \w; case folding is switched off so RE2 does not add
+# U+0345 (which folds to a Greek letter) to the class
+_RE2_WORD = r'(?-i:[\pL\pN_])'
+_RE2_NON_WORD = r'(?-i:[^\pL\pN_])'
+_WORD_CHAR = re.compile(r'\w')
+_ASCII_WORD_BYTE = re.compile(rb'\w')
+
+
+def re2_variant_pattern(variant: str, word_boundary: bool = False) -> str:
+    """
+    Pattern matching variant in RE2 syntax, for DuckDB and Arrow regex matching.
+
+    Used case-insensitively, it matches the same texts as the re pattern
+    for the variant. RE2's \\b only knows ASCII word characters, so each
+    boundary is spelled out as the character class Python's \\b looks at
+    (or the start/end of the text); the few letters whose case equivalence
+    differs between the engines are written as explicit classes.
+
+    Args:
+        variant: Funder name variant
+        word_boundary: Whether the re pattern wraps the variant in \\b
+
+    Returns:
+        RE2 pattern string
+    """
+    pattern = ''.join(_RE2_CASE_CLASSES.get(fold_case(c), re.escape(c)) for c in variant)
+    if word_boundary and variant:
+        if _WORD_CHAR.match(variant[0]):
+            pattern = f'(?:^|{_RE2_NON_WORD})' + pattern
+        else:
+            pattern = _RE2_WORD + pattern
+        if _WORD_CHAR.match(variant[-1]):
+            pattern += f'(?:{_RE2_NON_WORD}|$)'
+        else:
+            pattern += _RE2_WORD
+    return pattern
+
+
+def build_hyperscan_prefilter(variants: dict) -> tuple:
+    """
+    Compile the case-folded funder variants into a Hyperscan literal database.
+
+    scan_funders scans the UTF-8 bytes of fold_case(text) with it to find,
+    in one pass, the funders that match. Variants are matched as plain byte
+    strings, so no regex feature has to agree between Hyperscan and re: a
+    hit on a variant is a match, and a hit on an acronym is a match when
+    re's \\b holds at both ends of it. Every acronym occurrence is reported
+    so that one failing its boundaries cannot hide a later one; Hyperscan's
+    ASCII \\b drops the ones inside ASCII words up front (where the acronym
+    ends in an ASCII word character, re's \\b cannot hold there either).
+    Requires the optional hyperscan package (check HAS_HYPERSCAN).
+
+    Args:
+        variants: Dict mapping canonical name to its variant strings, in the
+                  same order as the patterns passed to scan_funders
+
+    Returns:
+        Tuple of (database, always_check) where each database id is 8 times
+        the position of the funder in `variants` plus the length of the
+        acronym (0 for other variants); database is None if there are no
+        non-empty variants
+    """
+    expressions = []
+    ids = []
+    flags = []
+    always_check = set()
+    for i, names in enumerate(variants.values()):
+        for name in names:
+            key = fold_case(name).encode('utf-8')
+            if not key:
+                always_check.add(i)
+                continue
+            acronym = is_acronym(name)
+            expression = ''.join(f'\\x{byte:02x}' for byte in key)
+            if acronym:
+                expression = ('\\b' if _ASCII_WORD_BYTE.match(key[:1]) else '') + expression
+                expression += '\\b' if _ASCII_WORD_BYTE.match(key[-1:]) else ''
+            expressions.append(expression.encode('ascii'))
+            ids.append(8 * i + (len(name) if acronym else 0))
+            # SINGLEMATCH for the rest since we only need to know whether they occur
+            flags.append(0 if acronym else hyperscan.HS_FLAG_SINGLEMATCH)
+    if not expressions:
+        return None, always_check
+
+    database = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    database.compile(expressions=expressions, ids=ids, elements=len(expressions), flags=flags)
+    return database, always_check
+
+
+def build_literal_prefilter(variants: dict) -> tuple:
+    """
+    Build an Aho-Corasick automaton over the case-folded funder variants.
+
+    scan_funders iterates it over fold_case(text) to find, in one pass, the
+    funders that match; as with build_hyperscan_prefilter, acronym hits
+    only count where re's \\b holds at both ends. Requires the pyahocorasick
+    package (check HAS_AHOCORASICK).
+
+    Args:
+        variants: Dict mapping canonical name to its variant strings, in the
+                  same order as the patterns passed to scan_funders
+
+    Returns:
+        Tuple of (automaton, always_check) where the automaton maps each
+        literal to (position, acronym length) pairs for its funders, the
+        length being 0 for variants that are not acronyms (automaton is
+        None if there are no non-empty variants)
+    """
+    automaton = ahocorasick.Automaton()
+    always_check = set()
+    for i, names in enumerate(variants.values()):
+        for name in names:
+            key = fold_case(name)
+            if not key:
+                always_check.add(i)
+                continue
+            length = len(name) if is_acronym(name) else 0
+            automaton.add_word(key, automaton.get(key, ()) + ((i, length),))
+    if not len(automaton):
+        return None, always_check
+    automaton.make_automaton()
+    return automaton, always_check
+
+
+def _at_word_boundaries(text: str, start: int, end: int) -> bool:
+    """Whether re's \\b holds at both ends of text[start:end] (non-empty)."""
+    # A space stands in for the outside of the text, which \\b treats as non-word
+    before = text[start - 1] if start else ' '
+    after = text[end] if end < len(text) else ' '
+    first = text[start]
+    last = text[end - 1]
+    return ((before.isalnum() or before == '_') != (first.isalnum() or first == '_')
+            and (last.isalnum() or last == '_') != (after.isalnum() or after == '_'))
+
+
+def scan_funders(text: str, patterns: dict, hyperscan_prefilter=None,
+                 literal_prefilter=None) -> list:
+    """
+    Find all funders whose pattern matches text.
+
+    With a prefilter, one pass over the case-folded text finds the funders
+    that match. fold_case keeps every character in place, so the word
+    boundaries of acronym hits are checked at the same positions in text.
+    Without a prefilter every pattern is searched. Results are identical to
+    searching every pattern separately.
+
+    Args:
+        text: Text to search
+        patterns: Dict mapping canonical name to compiled pattern
+        hyperscan_prefilter: Optional result of build_hyperscan_prefilter
+        literal_prefilter: Optional result of build_literal_prefilter (used
+                           when there is no Hyperscan prefilter)
+
+    Returns:
+        List of canonical funder names found, in `patterns` order
+    """
+    if hyperscan_prefilter is None and literal_prefilter is None:
+        return [name for name, pattern in patterns.items() if pattern.search(text)]
+
+    folded = fold_case(text)
+    found = set()
+    if hyperscan_prefilter is not None:
+        database, always_check = hyperscan_prefilter
+        if database is not None:
+            encoded = folded.encode('utf-8')
+            ascii_only = len(encoded) == len(folded)
+
+            def on_match(pattern_id, start, end, flags, context):
+                i, length = divmod(pattern_id, 8)
+                if length and i not in found:
+                    # Hyperscan reports byte offsets; acronyms are checked by character
+                    if not ascii_only:
+                        end = len(encoded[:end].decode('utf-8'))
+                    if not _at_word_boundaries(text, end - length, end):
+                        return
+                found.add(i)
+
+            database.scan(encoded, match_event_handler=on_match)
+    else:
+        automaton, always_check = literal_prefilter
+        if automaton is not None:
+            for last, hits in automaton.iter(folded):
+                for i, length in hits:
+                    if not length or (i not in found
+                                      and _at_word_boundaries(text, last + 1 - length, last + 1)):
+                        found.add(i)
+
+    names = list(patterns)
+    compiled = list(patterns.values())
+    found.update(i for i in always_check - found if compiled[i].search(text))
+    return [names[i] for i in sorted(found)]
+
+
+def scan_mismatches(texts, patterns: dict, **prefilters) -> list:
+    """
+    Texts where scan_funders disagrees with searching each pattern separately.
+
+    Used to check the Hyperscan and Aho-Corasick prefilters against plain re.
+
+    Args:
+        texts: Iterable of texts to check
+        patterns: Dict mapping canonical name to compiled pattern
+        prefilters: hyperscan_prefilter / literal_prefilter passed to scan_funders
+
+    Returns:
+        List of (text, expected, found) tuples for each disagreement
+    """
+    mismatches = []
+    for text in texts:
+        expected = [name for name, pattern in patterns.items() if pattern.search(text)]
+        found = scan_funders(text, patterns, **prefilters)
+        if found != expected:
+            mismatches.append((text, expected, found))
+    return mismatches
+
+
 def create_expanded_aliases(potential_funders_csv: Path,
                            base_aliases_csv: Path,
                            output_csv: Path,
@@ -303,13 +587,16 @@ def create_expanded_aliases(potential_funders_csv: Path,
     # Load existing aliases
     normalizer = FunderNormalizer(base_aliases_csv)
 
+    # Acronym and lowercased form of each canonical name, computed once
+    canonical_forms = []
+    for can_name in normalizer.get_all_canonical_names():
+        acronym = ''.join(w[0] for w in can_name.split() if w[0].isupper())
+        canonical_forms.append((can_name, acronym, can_name.lower()))
+
     # Find potential new aliases
     suggestions = []
 
-    for _, row in funders_df.iterrows():
-        name = row['name']
-        count = row['count']
-
+    for name, count in zip(funders_df['name'], funders_df['count']):
         # Check if already in aliases
         canonical = normalizer.get_canonical(name)
         if canonical != name:
@@ -318,19 +605,17 @@ def create_expanded_aliases(potential_funders_csv: Path,
         # Look for potential matches based on:
         # 1. Acronyms (short uppercase strings)
         # 2. Substring matches with canonical names
+        could_be_acronym = len(name) <= 6 and name.isupper()
+        name_lower = name.lower()
 
         potential_matches = []
-        for can_name in normalizer.get_all_canonical_names():
+        for can_name, acronym, can_lower in canonical_forms:
             # Check if name is acronym of canonical
-            if len(name) <= 6 and name.isupper():
-                # Could be acronym
-                words = can_name.split()
-                acronym = ''.join(w[0] for w in words if w[0].isupper())
-                if name == acronym:
-                    potential_matches.append(can_name)
+            if could_be_acronym and name == acronym:
+                potential_matches.append(can_name)
 
             # Check substring match
-            if name.lower() in can_name.lower() or can_name.lower() in name.lower():
+            if name_lower in can_lower or can_lower in name_lower:
                 potential_matches.append(can_name)
 
         if potential_matches:
@@ -385,6 +670,39 @@ if __name__ == '__main__':
     # Show all canonical funders
     print(f"\n{len(normalizer.get_all_canonical_names())} canonical funders loaded")
 
+    # Check the optional prefilters against searching each pattern with re,
+    # on texts mixing variants with case changes and non-ASCII neighbours
+    print("\n=== Prefilter Agreement ===")
+    rng = random.Random(0)
+    variants = {c: sorted(normalizer.get_variants(c)) for c in normalizer.search_patterns}
+    all_variants = [v for names in variants.values() for v in names]
+    fillers = ['', ' ', ' ', '-', '_', '1', 'x', 'é', 'ß', 'ſ', '\u212a', '\u0130', '\u0131', 'Σ',
+               '\u00a0', '\u2013', '(', ')']
+    fuzz_texts = list(test_texts)
+    for _ in range(5000):
+        parts = []
+        for _ in range(rng.randint(1, 4)):
+            variant = rng.choice(all_variants)
+            variant = rng.choice([variant, variant.lower(), variant.upper()])
+            parts.append(rng.choice(fillers) + variant + rng.choice(fillers))
+        fuzz_texts.append(''.join(parts))
+
+    prefilters = {}
+    if normalizer.hyperscan_prefilter is not None:
+        prefilters['Hyperscan'] = {'hyperscan_prefilter': normalizer.hyperscan_prefilter}
+    if HAS_AHOCORASICK:
+        prefilters['Aho-Corasick'] = {'literal_prefilter': build_literal_prefilter(variants)}
+    if not prefilters:
+        print("  No optional prefilter installed (hyperscan, pyahocorasick)")
+
+    disagreements = 0
+    for name, kwargs in prefilters.items():
+        mismatches = scan_mismatches(fuzz_texts, normalizer.search_patterns, **kwargs)
+        print(f"  {name}: {len(mismatches)} of {len(fuzz_texts)} texts differ from re")
+        for text, expected, found in mismatches[:5]:
+            print(f"    {text!r}: re {expected}, {name} {found}")
+        disagreements += len(mismatches)
+
     # Test parent/country lookups (v3 features)
     print("\n=== Parent Funder Lookups (v3) ===")
     test_funders = [
@@ -423,3 +741,6 @@ if __name__ == '__main__':
     print("Aggregated (parents only):", aggregated)
     aggregated_with_children = normalizer.aggregate_to_parents(test_counts, include_children=True)
     print("Aggregated (with children):", aggregated_with_children)
+
+    if disagreements:
+        raise SystemExit(1)
@@ -0,0 +1,58 @@
+"""Round-trip checks for the dashboard parquet written by build_dashboard_data_duckdb."""
+
+import sys
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'analysis'))
+
+import build_dashboard_data_duckdb as dashboard  # noqa: E402
+
+
+RECORDS = pa.table({
+    'pmid': pa.array([101, None, 103], pa.int64()),
+    'journal': ['J Neurosci', 'Neuron', None],
+    'affiliation_country': ['USA', None, 'Germany'],
+    'is_open_data': [True, False, False],
+    'is_open_code': [False, True, False],
+    'year': pa.array([2021, 2020, None], pa.int64()),
+    'license': ['CC BY', None, 'CC0'],
+    'combined_funding': ['Supported by the NIH.', None, 'Funded by the DFG.'],
+})
+FUNDER = pa.array([['NIH'], [], ['DFG']], pa.list_(pa.string()))
+
+
+def assert_pandas_dtypes(path):
+    df = pd.read_parquet(path)
+    assert list(df.columns) == list(dashboard.OUTPUT_PANDAS_DTYPES)
+    for column, dtype in dashboard.OUTPUT_PANDAS_DTYPES.items():
+        assert df[column].dtype == pd.api.types.pandas_dtype(dtype), column
+    assert df['pmid'].isna().sum() == 1
+    assert df['year'].isna().sum() == 1
+    return df
+
+
+def test_python_output_round_trips_through_pandas(tmp_path):
+    path = tmp_path / 'dashboard.parquet'
+    assert dashboard.write_output_python(str(path), RECORDS, FUNDER) == 3
+
+    df = assert_pandas_dtypes(path)
+    assert df['year'].tolist()[:2] == [2020, 2021]
+    assert list(df['funder'].iloc[1]) == ['NIH']
+    assert list(df['data_tags'].iloc[0]) == ['pmc_oa', 'unknown']
+
+
+def test_duckdb_output_round_trips_through_pandas(tmp_path):
+    path = tmp_path / 'dashboard.parquet'
+    conn = duckdb.connect()
+    conn.register('records', RECORDS)
+    conn.execute("CREATE TEMP TABLE merged AS SELECT * FROM records")
+
+    patterns = {'NIH': r'\bNIH\b', 'DFG': r'\bDFG\b'}
+    assert dashboard.write_output_duckdb(conn, str(path), patterns, {}) == 3
+
+    df = assert_pandas_dtypes(path)
+    assert sorted(len(f) for f in df['funder']) == [0, 1, 1]
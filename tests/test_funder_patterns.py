@@ -0,0 +1,71 @@
+"""Check the RE2 funder patterns (DuckDB and Arrow matching) against the re patterns."""
+
+import random
+import sys
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'analysis'))
+
+from funder_analysis.normalize_funders import FunderNormalizer  # noqa: E402
+from build_dashboard_data_duckdb import funder_match_sql  # noqa: E402
+
+ALIASES_CSV = Path(__file__).parent.parent / 'funder_analysis' / 'funder_aliases_v3.csv'
+
+# Neighbours where re and RE2 disagree unless the boundaries and case
+# equivalences are translated: non-ASCII letters and digits, U+0345 and
+# the dotted/dotless i
+FILLERS = ['', ' ', '-', '_', '1', 'x', 'é', 'ß', 'ſ', 'K', 'İ', 'ı', 'Σ', ' ',
+           '–', '(', '٣', 'ͅ', '́', '中', '\U0001d400']
+
+
+@pytest.fixture(scope='module')
+def normalizer():
+    return FunderNormalizer(ALIASES_CSV)
+
+
+@pytest.fixture(scope='module')
+def fuzz_texts(normalizer):
+    rng = random.Random(0)
+    all_variants = sorted(v for c in normalizer.search_patterns for v in normalizer.get_variants(c))
+    texts = []
+    for _ in range(3000):
+        parts = []
+        for _ in range(rng.randint(1, 3)):
+            variant = rng.choice(all_variants)
+            variant = rng.choice([variant, variant.lower(), variant.upper(),
+                                  variant.replace('I', 'İ').replace('i', 'ı')])
+            parts.append(rng.choice(FILLERS) + variant + rng.choice(FILLERS))
+        texts.append(''.join(parts))
+    return texts
+
+
+def expected_funders(normalizer, texts):
+    return [
+        [name for name, pattern in normalizer.search_patterns.items() if pattern.search(text)]
+        for text in texts
+    ]
+
+
+def test_duckdb_patterns_match_re(normalizer, fuzz_texts):
+    conn = duckdb.connect()
+    conn.register('texts', pa.table({'i': range(len(fuzz_texts)), 'text': fuzz_texts}))
+    found = conn.execute(
+        f"SELECT {funder_match_sql('text', normalizer.re2_patterns)} FROM texts ORDER BY i"
+    ).fetchall()
+    assert [row[0] for row in found] == expected_funders(normalizer, fuzz_texts)
+
+
+def test_arrow_patterns_match_re(normalizer, fuzz_texts):
+    texts = pa.array(fuzz_texts)
+    found = [[] for _ in fuzz_texts]
+    for name, pattern in normalizer.re2_patterns.items():
+        matches = pc.match_substring_regex(texts, pattern, ignore_case=True)
+        for i in pc.indices_nonzero(matches).to_pylist():
+            found[i].append(name)
+    assert found == expected_funders(normalizer, fuzz_texts)